@@ -2,16 +2,28 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import csv
+import io
 import json
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import groupby, islice
 import dateutil.parser
+import dateutil.rrule
 import babel
+import babel.dates
 from flask import Flask, render_template, request, Response, flash, redirect, url_for
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy.exc import SQLAlchemyError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from page_cache import PageCache
+from query_stats import QueryStats
+from search import NAME_SEARCH_LIMIT, install_name_search, name_matches
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -20,6 +32,12 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
+# schema changes live in migrations/, run them with `flask db upgrade`
+migrate = Migrate(app, db, render_as_batch=True)
+# Server-Timing headers, N+1 warnings and slow request reports
+QueryStats(app)
+# rendered venue and artist pages, dropped by every submission that writes
+page_cache = PageCache(app)
 
 # TODO: connect to a local postgresql database
 
@@ -38,6 +56,7 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary='venue_genres', order_by='Genre.name')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -49,25 +68,363 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary='artist_genres', order_by='Genre.name')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+class Show(db.Model):
+    __tablename__ = 'Show'
+    __table_args__ = (
+        # venue and artist pages read one venue's / artist's shows in start_time order
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+
+    venue = db.relationship('Venue', backref=db.backref('shows', lazy='dynamic'))
+    artist = db.relationship('Artist', backref=db.backref('shows', lazy='dynamic'))
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+# the primary keys serve "genres of this venue / artist", the reversed
+# indexes serve "venues / artists in this genre"
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+# location filters compare lower(state) and lower(city)
+db.Index('ix_venue_location', db.func.lower(Venue.state), db.func.lower(Venue.city))
+db.Index('ix_artist_location', db.func.lower(Artist.state), db.func.lower(Artist.city))
+
+# TODO complete all model relationships and properties, as a database migration.
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# shows listed per partition on a venue or artist page; the counts above
+# the lists cover every show
+SHOWS_LISTED = 100
+
+def show_partitions(owner_column, owner_id, counterpart):
+  # the shows of one venue (owner_column=Show.venue_id, counterpart=Artist)
+  # or one artist (Show.artist_id, Venue), split into past and upcoming with
+  # their counts, in one statement: a UNION ALL of two subqueries, each
+  # served in order by the (owner, start_time) index and limited to
+  # SHOWS_LISTED rows, with the counterpart's name and image from the join.
+  # Every row also carries the size of its whole partition, an uncorrelated
+  # scalar subquery counted once on the same index. Upcoming means after
+  # now, as on the listings
+  prefix = counterpart.__tablename__.lower()
+  now = datetime.now()
+
+  def partition(upcoming):
+    in_partition = Show.start_time > now if upcoming else Show.start_time <= now
+    total = db.session.query(db.func.count(Show.id)) \
+      .filter(owner_column == owner_id, in_partition) \
+      .as_scalar()
+    shows = db.session.query(
+      Show.start_time.label('start_time'),
+      counterpart.id.label('counterpart_id'),
+      counterpart.name.label('name'),
+      counterpart.image_link.label('image_link'),
+      db.literal(upcoming, db.Boolean).label('upcoming'),
+      total.label('total')) \
+      .join(counterpart) \
+      .filter(owner_column == owner_id, in_partition)
+    # most recent past shows first
+    shows = shows.order_by(Show.start_time if upcoming else Show.start_time.desc())
+    return db.session.query(shows.limit(SHOWS_LISTED).subquery())
+
+  rows = partition(False).union_all(partition(True)).all()
+
+  partitions = {False: [], True: []}
+  counts = {False: 0, True: 0}
+  for start_time, counterpart_id, name, image_link, upcoming, total in rows:
+    partitions[bool(upcoming)].append({
+      prefix + "_id": counterpart_id,
+      prefix + "_name": name,
+      prefix + "_image_link": image_link,
+      # a datetime, formatted by the datetime filter without reparsing
+      "start_time": start_time,
+    })
+    counts[bool(upcoming)] = total
+  # UNION ALL keeps no order of its own
+  partitions[False].sort(key=lambda show: show["start_time"], reverse=True)
+  partitions[True].sort(key=lambda show: show["start_time"])
+
+  return {
+    "past_shows": partitions[False],
+    "upcoming_shows": partitions[True],
+    "past_shows_count": counts[False],
+    "upcoming_shows_count": counts[True],
+  }
+
+def search_results(model, owner_column, criteria):
+  # search hits with their upcoming show counts in one query: the name and
+  # location criteria narrow the rows first, then one outer join and GROUP
+  # BY count the upcoming shows of every hit together. The first
+  # NAME_SEARCH_LIMIT hits by name are returned, once every criterion applied
+  num_upcoming_shows = db.func.count(Show.id)
+  rows = db.session.query(model.id, model.name, num_upcoming_shows) \
+    .outerjoin(Show, db.and_(owner_column == model.id, Show.start_time > datetime.now())) \
+    .filter(*criteria) \
+    .group_by(model.id, model.name) \
+    .order_by(model.name) \
+    .limit(NAME_SEARCH_LIMIT) \
+    .all()
+
+  return {
+    "count": len(rows),
+    "data": [{
+      "id": row_id,
+      "name": name,
+      "num_upcoming_shows": upcoming,
+    } for row_id, name, upcoming in rows]
+  }
+
+def genre_members(member_column, genre_id):
+  # ids of the venues (member_column=venue_genres.c.venue_id) or artists
+  # listed under a genre, read from the (genre_id, member) index
+  association = member_column.table
+  return db.session.query(member_column).filter(association.c.genre_id == genre_id)
+
+def location_criteria(model):
+  # optional city and state request values, compared ignoring case so the
+  # lower(state), lower(city) index applies
+  criteria = []
+  for field in ('state', 'city'):
+    value = request.values.get(field, '').strip()
+    if value:
+      criteria.append(db.func.lower(getattr(model, field)) == value.lower())
+  return criteria
+
+def search_criteria(model, member_column):
+  # the search term matches anywhere in the name, ignoring case, within
+  # the requested location; genre must be one of the venue's / artist's
+  criteria = location_criteria(model)
+  search_term = request.values.get('search_term', '').strip()
+  if search_term:
+    criteria.append(name_matches(model, search_term))
+  genre = request.values.get('genre', '').strip()
+  if genre:
+    genre_id = db.session.query(Genre.id).filter(Genre.name == genre).as_scalar()
+    criteria.append(model.id.in_(genre_members(member_column, genre_id)))
+  return criteria
+
+def genres_named(names):
+  # the Genre rows for the names submitted by a form, one query for the
+  # ones that exist, new rows for the others
+  names = sorted({name.strip() for name in names if name.strip()})
+  genres = Genre.query.filter(Genre.name.in_(names)).all() if names else []
+  known = {genre.name for genre in genres}
+  genres.extend(Genre(name=name) for name in names if name not in known)
+  return genres
+
+#----------------------------------------------------------------------------#
+# Scheduling.
+#----------------------------------------------------------------------------#
+
+# a show is taken to last this long: another show at the same venue, or
+# with the same artist, starting closer than this is a double booking
+SHOW_LENGTH = timedelta(hours=3)
+# the most shows one submission may schedule, which also bounds how far an
+# open ended recurrence rule is expanded
+MAX_SCHEDULED_SHOWS = 500
+
+class ScheduleError(Exception):
+  def __init__(self, problems):
+    super().__init__('; '.join(problems))
+    self.problems = problems
+
+def naive_local(start_time):
+  # the app stores local times without a zone, like datetime.now()
+  if start_time.tzinfo is not None:
+    start_time = start_time.astimezone().replace(tzinfo=None)
+  return start_time
+
+def form_show(form):
+  # (artist_id, venue_id, start_time) from a ShowForm or ShowScheduleForm
+  problems = []
+  try:
+    artist_id = int(form.artist_id.data)
+  except (TypeError, ValueError):
+    problems.append('Artist ID must be a number.')
+  try:
+    venue_id = int(form.venue_id.data)
+  except (TypeError, ValueError):
+    problems.append('Venue ID must be a number.')
+  # DateTimeField only takes its exact format, with seconds; anything
+  # dateutil reads, e.g. the placeholder's YYYY-MM-DD HH:MM, is accepted
+  start_time = form.start_time.data
+  if start_time is None:
+    try:
+      start_time = naive_local(dateutil.parser.parse(form.start_time.raw_data[0]))
+    except (IndexError, TypeError, ValueError, OverflowError):
+      problems.append('Start time must look like YYYY-MM-DD HH:MM.')
+  if problems:
+    raise ScheduleError(problems)
+  return artist_id, venue_id, start_time
+
+def recurring_shows(artist_id, venue_id, first_start, recurrence):
+  # a residency: the dates of an iCalendar RRULE such as FREQ=WEEKLY;COUNT=12
+  # or FREQ=WEEKLY;UNTIL=20350601, starting with first_start
+  if not recurrence.strip():
+    raise ScheduleError(['Enter a recurrence rule, or shows as CSV.'])
+  try:
+    rule = dateutil.rrule.rrulestr(recurrence.strip(), dtstart=first_start)
+  except (ValueError, TypeError) as error:
+    raise ScheduleError(['Invalid recurrence rule: {}.'.format(error)])
+  start_times = list(islice(rule, MAX_SCHEDULED_SHOWS + 1))
+  if len(start_times) > MAX_SCHEDULED_SHOWS:
+    raise ScheduleError(['The recurrence rule gives more than {} shows, limit it with COUNT or UNTIL.'.format(
+      MAX_SCHEDULED_SHOWS)])
+  return [(artist_id, venue_id, start_time) for start_time in start_times]
+
+def uploaded_csv(upload):
+  # the text of an uploaded CSV file, a byte order mark dropped
+  try:
+    return upload.read().decode('utf-8-sig')
+  except UnicodeDecodeError as error:
+    raise ScheduleError(['The uploaded file is not UTF-8 text (byte {}).'.format(error.start)])
+
+def csv_shows(text):
+  # one artist_id,venue_id,start_time row per show, the header line optional
+  shows, problems = [], []
+  for line_number, row in enumerate(csv.reader(io.StringIO(text)), 1):
+    if not ''.join(row).strip() or (line_number == 1 and row[0].strip() == 'artist_id'):
+      continue
+    try:
+      artist_id, venue_id, start_time = row
+      shows.append((int(artist_id), int(venue_id), naive_local(dateutil.parser.parse(start_time))))
+    except (ValueError, OverflowError):
+      problems.append('Line {}: expected artist_id,venue_id,start_time.'.format(line_number))
+  if len(shows) > MAX_SCHEDULED_SHOWS:
+    problems.append('At most {} shows can be scheduled at once.'.format(MAX_SCHEDULED_SHOWS))
+  if problems:
+    raise ScheduleError(problems)
+  return shows
+
+def booking_conflicts(shows):
+  # one range query fetches the existing shows of the venues and artists
+  # involved around the proposed dates; then, per venue and per artist,
+  # existing and proposed shows are walked in start order and any two
+  # starting less than SHOW_LENGTH apart, at least one of them new, clash
+  start_times = [start_time for _, _, start_time in shows]
+  existing = db.session.query(Show.artist_id, Show.venue_id, Show.start_time) \
+    .filter(Show.start_time > min(start_times) - SHOW_LENGTH) \
+    .filter(Show.start_time < max(start_times) + SHOW_LENGTH) \
+    .filter(db.or_(Show.venue_id.in_({venue_id for _, venue_id, _ in shows}),
+                   Show.artist_id.in_({artist_id for artist_id, _, _ in shows}))) \
+    .all()
+
+  bookings = {}
+  for proposed, rows in ((False, existing), (True, shows)):
+    for artist_id, venue_id, start_time in rows:
+      bookings.setdefault(('Venue', venue_id), []).append((start_time, proposed))
+      bookings.setdefault(('Artist', artist_id), []).append((start_time, proposed))
+
+  problems = []
+  for (kind, owner_id), times in sorted(bookings.items()):
+    times.sort()
+    for (earlier, earlier_proposed), (later, later_proposed) in zip(times, times[1:]):
+      if (earlier_proposed or later_proposed) and later - earlier < SHOW_LENGTH:
+        problems.append('{} {} is double-booked: shows at {:%Y-%m-%d %H:%M} and {:%Y-%m-%d %H:%M}.'.format(
+          kind, owner_id, earlier, later))
+  return problems
+
+def schedule_shows(shows):
+  # inserts (artist_id, venue_id, start_time) shows in one transaction,
+  # after one lookup each for the artist and venue ids and one range query
+  # for double bookings; raises ScheduleError listing every problem
+  if not shows:
+    raise ScheduleError(['There are no shows to schedule.'])
+  artist_ids = {artist_id for artist_id, _, _ in shows}
+  venue_ids = {venue_id for _, venue_id, _ in shows}
+  known_artists = {artist_id for artist_id, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+  known_venues = {venue_id for venue_id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+  problems = ['Artist {} does not exist.'.format(artist_id) for artist_id in sorted(artist_ids - known_artists)]
+  problems += ['Venue {} does not exist.'.format(venue_id) for venue_id in sorted(venue_ids - known_venues)]
+  if not problems:
+    problems = booking_conflicts(shows)
+  if problems:
+    raise ScheduleError(problems)
+
+  # one executemany for all the rows
+  db.session.bulk_insert_mappings(Show, [{
+    "artist_id": artist_id,
+    "venue_id": venue_id,
+    "start_time": start_time,
+  } for artist_id, venue_id, start_time in shows])
+  db.session.commit()
+  return len(shows)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+# babel's named formats, the locale's own patterns
+NAMED_DATETIME_FORMATS = ('short', 'medium', 'long', 'full')
+
+def datetime_pattern(format, locale):
+  # the pattern for a format: Fyyur's own, a named babel format combined from
+  # the locale's date and time patterns the way babel.dates.format_datetime
+  # does, or a pattern given as is
+  if format in DATETIME_FORMATS:
+    return DATETIME_FORMATS[format]
+  if format in NAMED_DATETIME_FORMATS:
+    return babel.dates.get_datetime_format(format, locale) \
+      .replace('{0}', babel.dates.get_time_format(format, locale).pattern) \
+      .replace('{1}', babel.dates.get_date_format(format, locale).pattern)
+  return format
+
+@lru_cache(maxsize=64)
+def datetime_formatter(format, locale):
+  # the parsed babel pattern and locale for a (format, locale) pair, so
+  # neither is resolved again for every timestamp rendered
+  locale = babel.Locale.parse(locale or babel.dates.LC_TIME)
+  return babel.dates.parse_pattern(datetime_pattern(format, locale)), locale
+
+# detail pages render the same few show times over and over; the LRU
+# keeps the most recent formatted values, datetime objects and ISO strings.
+# Aware datetimes for one instant at different offsets are equal, so the
+# key carries the tzinfo too, they are formatted in their own zones
+@lru_cache(maxsize=4096)
+def formatted_datetime(value, tzinfo, format, locale):
+  if isinstance(value, datetime):
+    date = value
+  else:
+    date = dateutil.parser.parse(value)
+  if date.tzinfo is None:
+    # what babel.dates.format_datetime assumes for naive datetimes
+    date = date.replace(tzinfo=babel.dates.UTC)
+  pattern, locale = datetime_formatter(format, locale)
+  return pattern.apply(date, locale)
+
+def format_datetime(value, format='medium', locale=None):
+  return formatted_datetime(value, getattr(value, 'tzinfo', None), format, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -75,6 +432,10 @@ app.jinja_env.filters['datetime'] = format_datetime
 # Controllers.
 #----------------------------------------------------------------------------#
 
+@app.before_first_request
+def install_search():
+  install_name_search(db.engine, [Venue, Artist])
+
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -85,128 +446,54 @@ def index():
 
 @app.route('/venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "city": "San Francisco",
-    "state": "CA",
-    "venues": [{
-      "id": 1,
-      "name": "The Musical Hop",
-      "num_upcoming_shows": 0,
-    }, {
-      "id": 3,
-      "name": "Park Square Live Music & Coffee",
-      "num_upcoming_shows": 1,
-    }]
-  }, {
-    "city": "New York",
-    "state": "NY",
+  # one round-trip whatever the number of venues: each venue with its count
+  # of upcoming shows, already ordered by area, then grouped here. The
+  # start_time filter sits in the join so venues without upcoming shows
+  # still come back, with a count of 0
+  num_upcoming_shows = db.func.count(Show.id)
+  rows = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, num_upcoming_shows) \
+    .outerjoin(Show, db.and_(Show.venue_id == Venue.id, Show.start_time > datetime.now())) \
+    .group_by(Venue.id, Venue.name, Venue.city, Venue.state) \
+    .order_by(Venue.state, Venue.city, Venue.name) \
+    .all()
+
+  data = [{
+    "city": city,
+    "state": state,
     "venues": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }]
+      "id": venue_id,
+      "name": name,
+      "num_upcoming_shows": upcoming,
+    } for venue_id, name, _, _, upcoming in area]
+  } for (state, city), area in groupby(rows, key=lambda row: (row.state, row.city))]
   return render_template('pages/venues.html', areas=data);
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  response={
-    "count": 1,
-    "data": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }
+  # partial, case-insensitive match on the venue name: "Hop" finds "The
+  # Musical Hop", "Music" also finds "Park Square Live Music & Coffee".
+  # Optional city, state and genre fields narrow the results
+  criteria = search_criteria(Venue, venue_genres.c.venue_id)
+  response = search_results(Venue, Show.venue_id, criteria)
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "past_shows": [{
-      "artist_id": 4,
-      "artist_name": "Guns N Petals",
-      "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
+  venue = Venue.query.get_or_404(venue_id)
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": [genre.name for genre in venue.genres],
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "facebook_link": venue.facebook_link,
+    "image_link": venue.image_link,
+    **show_partitions(Show.venue_id, venue.id, Artist),
   }
-  data2={
-    "id": 2,
-    "name": "The Dueling Pianos Bar",
-    "genres": ["Classical", "R&B", "Hip-Hop"],
-    "address": "335 Delancey Street",
-    "city": "New York",
-    "state": "NY",
-    "phone": "914-003-1132",
-    "website": "https://www.theduelingpianos.com",
-    "facebook_link": "https://www.facebook.com/theduelingpianos",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1497032205916-ac775f0649ae?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=750&q=80",
-    "past_shows": [],
-    "upcoming_shows": [],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 3,
-    "name": "Park Square Live Music & Coffee",
-    "genres": ["Rock n Roll", "Jazz", "Classical", "Folk"],
-    "address": "34 Whiskey Moore Ave",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "415-000-1234",
-    "website": "https://www.parksquarelivemusicandcoffee.com",
-    "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-    "past_shows": [{
-      "artist_id": 5,
-      "artist_name": "Matt Quevedo",
-      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 1,
-  }
-  data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
@@ -218,18 +505,30 @@ def create_venue_form():
   return render_template('forms/new_venue.html', form=form)
 
 @app.route('/venues/create', methods=['POST'])
+@page_cache.invalidates
 def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  form = VenueForm(request.form)
+  venue = Venue(
+    name=form.name.data,
+    city=form.city.data,
+    state=form.state.data,
+    address=form.address.data,
+    phone=form.phone.data,
+    image_link=form.image_link.data,
+    facebook_link=form.facebook_link.data,
+    genres=genres_named(form.genres.data),
+  )
+  try:
+    db.session.add(venue)
+    db.session.commit()
+    flash('Venue ' + venue.name + ' was successfully listed!')
+  except SQLAlchemyError:
+    db.session.rollback()
+    flash('An error occurred. Venue ' + form.name.data + ' could not be listed.')
   return render_template('pages/home.html')
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
+@page_cache.invalidates
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -257,95 +556,29 @@ def artists():
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  response={
-    "count": 1,
-    "data": [{
-      "id": 4,
-      "name": "Guns N Petals",
-      "num_upcoming_shows": 0,
-    }]
-  }
+  # partial, case-insensitive match on the artist name: "A" finds "Guns N
+  # Petals", "Matt Quevado" and "The Wild Sax Band", "band" finds "The Wild
+  # Sax Band". Optional city, state and genre fields narrow the results
+  criteria = search_criteria(Artist, artist_genres.c.artist_id)
+  response = search_results(Artist, Show.artist_id, criteria)
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "past_shows": [{
-      "venue_id": 1,
-      "venue_name": "The Musical Hop",
-      "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
+  # shows the artist page with the given artist_id
+  artist = Artist.query.get_or_404(artist_id)
+  data = {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": [genre.name for genre in artist.genres],
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "facebook_link": artist.facebook_link,
+    "image_link": artist.image_link,
+    **show_partitions(Show.artist_id, artist.id, Venue),
   }
-  data2={
-    "id": 5,
-    "name": "Matt Quevedo",
-    "genres": ["Jazz"],
-    "city": "New York",
-    "state": "NY",
-    "phone": "300-400-5000",
-    "facebook_link": "https://www.facebook.com/mattquevedo923251523",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "past_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 6,
-    "name": "The Wild Sax Band",
-    "genres": ["Jazz", "Classical"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "432-325-5432",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "past_shows": [],
-    "upcoming_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 3,
-  }
-  data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
@@ -370,6 +603,7 @@ def edit_artist(artist_id):
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@page_cache.invalidates
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
@@ -397,6 +631,7 @@ def edit_venue(venue_id):
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@page_cache.invalidates
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
@@ -411,18 +646,46 @@ def create_artist_form():
   return render_template('forms/new_artist.html', form=form)
 
 @app.route('/artists/create', methods=['POST'])
+@page_cache.invalidates
 def create_artist_submission():
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
+  form = ArtistForm(request.form)
+  artist = Artist(
+    name=form.name.data,
+    city=form.city.data,
+    state=form.state.data,
+    phone=form.phone.data,
+    image_link=form.image_link.data,
+    facebook_link=form.facebook_link.data,
+    genres=genres_named(form.genres.data),
+  )
+  try:
+    db.session.add(artist)
+    db.session.commit()
+    flash('Artist ' + artist.name + ' was successfully listed!')
+  except SQLAlchemyError:
+    db.session.rollback()
+    flash('An error occurred. Artist ' + form.name.data + ' could not be listed.')
   return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+@app.route('/genres/<genre_name>')
+def browse_genre(genre_name):
+  # venues and artists of one genre, optionally in one place, e.g.
+  # /genres/Jazz?state=CA: a lookup on the unique genre name, then one
+  # query per list driven by the (genre_id, member) and location indexes
+  genre = Genre.query.filter_by(name=genre_name).first_or_404()
+  venue_criteria = location_criteria(Venue) + [Venue.id.in_(genre_members(venue_genres.c.venue_id, genre.id))]
+  artist_criteria = location_criteria(Artist) + [Artist.id.in_(genre_members(artist_genres.c.artist_id, genre.id))]
+  return render_template('pages/browse_genre.html',
+    genre=genre.name,
+    location=', '.join(filter(None, (request.args.get('city'), request.args.get('state')))),
+    venues=search_results(Venue, Show.venue_id, venue_criteria),
+    artists=search_results(Artist, Show.artist_id, artist_criteria))
+
 #  Shows
 #  ----------------------------------------------------------------
 
@@ -476,15 +739,46 @@ def create_shows():
   return render_template('forms/new_show.html', form=form)
 
 @app.route('/shows/create', methods=['POST'])
+@page_cache.invalidates
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
+  try:
+    schedule_shows([form_show(ShowForm(request.form))])
+    flash('Show was successfully listed!')
+  except ScheduleError as error:
+    flash('Show could not be listed. ' + ' '.join(error.problems))
+  except SQLAlchemyError:
+    db.session.rollback()
+    flash('An error occurred. Show could not be listed.')
+  return render_template('pages/home.html')
 
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+@app.route('/shows/schedule')
+def schedule_shows_form():
+  form = ShowScheduleForm()
+  return render_template('forms/schedule_shows.html', form=form)
+
+@app.route('/shows/schedule', methods=['POST'])
+@page_cache.invalidates
+def schedule_shows_submission():
+  # many shows in one submission: a residency from a recurrence rule, or
+  # any list of shows as CSV (typed in or uploaded). Nothing is inserted
+  # unless every show is valid
+  form = ShowScheduleForm(request.form)
+  upload = request.files.get('shows_file')
+  try:
+    shows_csv = uploaded_csv(upload) if upload and upload.filename else form.shows_csv.data
+    if shows_csv and shows_csv.strip():
+      shows = csv_shows(shows_csv)
+    else:
+      shows = recurring_shows(*form_show(form), form.recurrence.data or '')
+    count = schedule_shows(shows)
+  except ScheduleError as error:
+    return render_template('forms/schedule_shows.html', form=form, problems=error.problems), 400
+  except SQLAlchemyError:
+    db.session.rollback()
+    flash('An error occurred. Shows could not be scheduled.')
+    return render_template('pages/home.html')
+  flash('{} shows were successfully scheduled!'.format(count))
   return render_template('pages/home.html')
 
 @app.errorhandler(404)
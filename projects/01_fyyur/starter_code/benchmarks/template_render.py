@@ -0,0 +1,106 @@
+'''
+Show time rendering benchmark
+
+Renders the artist page with a few hundred shows, the size of a busy
+residency, and reports the milliseconds per page for four ways of
+formatting the show times:
+
+    previous    ISO strings reparsed and formatted by babel on every call
+    iso-cold    ISO strings through the new filter, cache cleared per page
+    dt-cold     datetime objects (what the venue and artist pages pass),
+                cache cleared per page
+    dt-warm     datetime objects, cache kept between pages
+
+    python benchmarks/template_render.py --shows 400 --pages 200
+'''
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+import app as fyyur
+
+
+def previous_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def artist_page(shows, iso):
+  # weekly shows around now, half of them past, like a long residency
+  now = datetime.now().replace(minute=0, second=0, microsecond=0)
+  times = [now + timedelta(weeks=week - shows // 2, hours=20 - now.hour) for week in range(shows)]
+  listed = [{
+    "venue_id": 1,
+    "venue_name": "Park Square Live Music & Coffee",
+    "venue_image_link": "",
+    "start_time": start_time.isoformat() if iso else start_time,
+  } for start_time in times]
+  past, upcoming = listed[:shows // 2], listed[shows // 2:]
+  return {
+    "id": 1,
+    "name": "The Wild Sax Band",
+    "genres": ["Jazz", "Classical"],
+    "city": "San Francisco",
+    "state": "CA",
+    "phone": "432-325-5432",
+    "facebook_link": "",
+    "image_link": "",
+    "past_shows": past,
+    "upcoming_shows": upcoming,
+    "past_shows_count": len(past),
+    "upcoming_shows_count": len(upcoming),
+  }
+
+
+def time_pages(artist, pages, before_page=None):
+  started = time.perf_counter()
+  for _ in range(pages):
+    if before_page is not None:
+      before_page()
+    render_template('pages/show_artist.html', artist=artist)
+  return (time.perf_counter() - started) * 1000 / pages
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--shows', type=int, default=400)
+  parser.add_argument('--pages', type=int, default=200)
+  args = parser.parse_args()
+
+  app = fyyur.app
+  with app.test_request_context('/artists/1'):
+    iso_page = artist_page(args.shows, iso=True)
+    datetime_page = artist_page(args.shows, iso=False)
+
+    app.jinja_env.filters['datetime'] = previous_format_datetime
+    render_template('pages/show_artist.html', artist=iso_page)
+    previous = time_pages(iso_page, args.pages)
+
+    app.jinja_env.filters['datetime'] = fyyur.format_datetime
+    iso_cold = time_pages(iso_page, args.pages, fyyur.formatted_datetime.cache_clear)
+    datetime_cold = time_pages(datetime_page, args.pages, fyyur.formatted_datetime.cache_clear)
+    render_template('pages/show_artist.html', artist=datetime_page)
+    datetime_warm = time_pages(datetime_page, args.pages)
+
+  print('{} shows per page, {} pages'.format(args.shows, args.pages))
+  print('{:<12} {:>10} {:>9}'.format('filter', 'ms/page', 'speedup'))
+  for name, ms in (('previous', previous), ('iso-cold', iso_cold),
+                   ('dt-cold', datetime_cold), ('dt-warm', datetime_warm)):
+    print('{:<12} {:>10.2f} {:>8.1f}x'.format(name, ms, previous / ms))
+
+
+if __name__ == '__main__':
+  main()
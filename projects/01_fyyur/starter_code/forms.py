@@ -1,6 +1,6 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, TextAreaField
 from wtforms.validators import DataRequired, AnyOf, URL
 
 class ShowForm(Form):
@@ -16,6 +16,26 @@ class ShowForm(Form):
         default= datetime.today()
     )
 
+class ShowScheduleForm(Form):
+    artist_id = StringField(
+        'artist_id'
+    )
+    venue_id = StringField(
+        'venue_id'
+    )
+    start_time = DateTimeField(
+        'start_time',
+        default= datetime.today()
+    )
+    recurrence = StringField(
+        # iCalendar RRULE, e.g. FREQ=WEEKLY;COUNT=12
+        'recurrence'
+    )
+    shows_csv = TextAreaField(
+        # artist_id,venue_id,start_time per line
+        'shows_csv'
+    )
+
 class VenueForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -0,0 +1,64 @@
+"""Venue, Artist and Show tables
+
+Revision ID: 5c0e1b7a2d41
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0e1b7a2d41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# the schema as it was before migrations: databases set up by hand or with
+# db.create_all() may already have some of these tables, only the missing
+# ones are created
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'Venue' not in tables:
+        op.create_table('Venue',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('name', sa.String(), nullable=True),
+                        sa.Column('city', sa.String(length=120), nullable=True),
+                        sa.Column('state', sa.String(length=120), nullable=True),
+                        sa.Column('address', sa.String(length=120), nullable=True),
+                        sa.Column('phone', sa.String(length=120), nullable=True),
+                        sa.Column('image_link', sa.String(length=500), nullable=True),
+                        sa.Column('facebook_link', sa.String(length=120), nullable=True),
+                        sa.PrimaryKeyConstraint('id'))
+
+    if 'Artist' not in tables:
+        op.create_table('Artist',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('name', sa.String(), nullable=True),
+                        sa.Column('city', sa.String(length=120), nullable=True),
+                        sa.Column('state', sa.String(length=120), nullable=True),
+                        sa.Column('phone', sa.String(length=120), nullable=True),
+                        sa.Column('genres', sa.String(length=120), nullable=True),
+                        sa.Column('image_link', sa.String(length=500), nullable=True),
+                        sa.Column('facebook_link', sa.String(length=120), nullable=True),
+                        sa.PrimaryKeyConstraint('id'))
+
+    if 'Show' not in tables:
+        op.create_table('Show',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('venue_id', sa.Integer(), nullable=False),
+                        sa.Column('artist_id', sa.Integer(), nullable=False),
+                        sa.Column('start_time', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint(['artist_id'], ['Artist.id']),
+                        sa.ForeignKeyConstraint(['venue_id'], ['Venue.id']),
+                        sa.PrimaryKeyConstraint('id'))
+        op.create_index('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time'])
+        op.create_index('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_table('Show')
+    op.drop_table('Artist')
+    op.drop_table('Venue')
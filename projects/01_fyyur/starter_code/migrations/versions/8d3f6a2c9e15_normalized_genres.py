@@ -0,0 +1,120 @@
+"""Genre table with venue and artist association tables, backfilled from Artist.genres
+
+Revision ID: 8d3f6a2c9e15
+Revises: 5c0e1b7a2d41
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f6a2c9e15'
+down_revision = '5c0e1b7a2d41'
+branch_labels = None
+depends_on = None
+
+# artists read and linked per batch while backfilling
+BACKFILL_BATCH_SIZE = 500
+
+genre = sa.table('Genre', sa.column('id', sa.Integer), sa.column('name', sa.String))
+artist = sa.table('Artist', sa.column('id', sa.Integer), sa.column('genres', sa.String))
+artist_genres = sa.table('artist_genres',
+                         sa.column('artist_id', sa.Integer),
+                         sa.column('genre_id', sa.Integer))
+
+
+def split_genres(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def genre_ids(connection, names):
+    # ids for the names, inserting the genres not seen yet
+    found = dict(connection.execute(
+        sa.select([genre.c.name, genre.c.id]).where(genre.c.name.in_(names))).fetchall())
+    missing = sorted(names - set(found))
+    if missing:
+        connection.execute(genre.insert(), [{'name': name} for name in missing])
+        found.update(connection.execute(
+            sa.select([genre.c.name, genre.c.id]).where(genre.c.name.in_(missing))).fetchall())
+    return found
+
+
+# walks the artists in id order, BACKFILL_BATCH_SIZE at a time, so memory
+# and statement sizes stay flat however many artists there are
+def backfill_artist_genres(connection):
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([artist.c.id, artist.c.genres])
+            .where(artist.c.id > last_id)
+            .order_by(artist.c.id)
+            .limit(BACKFILL_BATCH_SIZE)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        names = {artist_id: split_genres(genres) for artist_id, genres in rows}
+        ids = genre_ids(connection, set().union(*names.values()))
+        links = [{'artist_id': artist_id, 'genre_id': ids[name]}
+                 for artist_id, artist_names in names.items() for name in sorted(artist_names)]
+        if links:
+            connection.execute(artist_genres.insert(), links)
+
+
+def upgrade():
+    op.create_table('Genre',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.String(length=120), nullable=False),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('name'))
+    op.create_table('venue_genres',
+                    sa.Column('venue_id', sa.Integer(), nullable=False),
+                    sa.Column('genre_id', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('venue_id', 'genre_id'))
+    op.create_index('ix_venue_genres_genre_id_venue_id', 'venue_genres', ['genre_id', 'venue_id'])
+    op.create_table('artist_genres',
+                    sa.Column('artist_id', sa.Integer(), nullable=False),
+                    sa.Column('genre_id', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('artist_id', 'genre_id'))
+    op.create_index('ix_artist_genres_genre_id_artist_id', 'artist_genres', ['genre_id', 'artist_id'])
+
+    backfill_artist_genres(op.get_bind())
+
+    with op.batch_alter_table('Artist') as batch_op:
+        batch_op.drop_column('genres')
+
+    # after the batch operation: SQLite rebuilds Artist for it and would
+    # not carry expression indexes over
+    op.create_index('ix_venue_location', 'Venue', [sa.text('lower(state)'), sa.text('lower(city)')])
+    op.create_index('ix_artist_location', 'Artist', [sa.text('lower(state)'), sa.text('lower(city)')])
+
+
+# puts the comma separated column back, filled from artist_genres; venue
+# genres had no column before and are dropped
+def downgrade():
+    op.drop_index('ix_artist_location', table_name='Artist')
+    op.drop_index('ix_venue_location', table_name='Venue')
+    with op.batch_alter_table('Artist') as batch_op:
+        batch_op.add_column(sa.Column('genres', sa.String(length=120), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select([artist_genres.c.artist_id, genre.c.name])
+        .select_from(artist_genres.join(genre, genre.c.id == artist_genres.c.genre_id))
+        .order_by(artist_genres.c.artist_id, genre.c.name)).fetchall()
+    genres = {}
+    for artist_id, name in rows:
+        genres.setdefault(artist_id, []).append(name)
+    for artist_id, names in genres.items():
+        connection.execute(artist.update().where(artist.c.id == artist_id)
+                           .values(genres=','.join(names)[:120]))
+
+    op.drop_table('artist_genres')
+    op.drop_table('venue_genres')
+    op.drop_table('Genre')
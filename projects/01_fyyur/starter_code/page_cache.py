@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session
+
+PAGE_CACHE_SIZE = 256
+PAGE_CACHE_TTL = 60
+
+'''
+Page cache stores
+    hold rendered pages and the data version they were rendered under
+
+        get(key)            the (expires_at, body) stored under key, or None
+        set(key, value)     stores value under key
+        version()           the current data version
+        bump()              moves to a new data version and drops every page
+'''
+
+'''
+MemoryStore
+    per process LRU of at most max_entries pages; with several worker
+    processes each keeps its own copy and only sees its own bumps, use
+    FileSystemStore there
+'''
+class MemoryStore:
+  def __init__(self, max_entries=PAGE_CACHE_SIZE):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.current = 0
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      value = self.entries.get(key)
+      if value is not None:
+        self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    with self.lock:
+      self.entries[key] = value
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def version(self):
+    return self.current
+
+  def bump(self):
+    with self.lock:
+      self.current += 1
+      self.entries.clear()
+
+
+'''
+FileSystemStore
+    one file per page in directory, shared by every worker on the host; the
+    data version is a random token in directory/version, so bumps from
+    different workers never collide. Files are written to a temporary name
+    and renamed into place, readers never see half a page
+    a page file is a one line JSON header holding expires_at, then the page
+    as UTF-8; nothing read back is unpickled or evaluated, so a file planted
+    in the directory can at worst be served as a page. Expired pages are
+    removed at most every prune_interval seconds as pages are stored, which
+    also clears pages a bump raced with, and bump removes them all
+'''
+class FileSystemStore:
+  version_file = 'version'
+  prune_interval = 60
+
+  def __init__(self, directory):
+    self.directory = directory
+    self.pruned_at = 0
+    os.makedirs(directory, exist_ok=True)
+
+  def path(self, key):
+    return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.page')
+
+  def write(self, path, data):
+    handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as output:
+      output.write(data)
+    os.replace(temporary, path)
+
+  def read(self, path, header_only=False):
+    # (expires_at, body) from a page file, None if it is missing or not a page
+    try:
+      with open(path, 'rb') as page:
+        expires_at = json.loads(page.readline().decode('utf-8'))['expires_at']
+        body = None if header_only else page.read().decode('utf-8')
+    except (OSError, ValueError, KeyError, TypeError):
+      return None
+    if not isinstance(expires_at, (int, float)):
+      return None
+    return expires_at, body
+
+  def get(self, key):
+    return self.read(self.path(key))
+
+  def set(self, key, value):
+    expires_at, body = value
+    header = json.dumps({'expires_at': expires_at}).encode('utf-8')
+    self.write(self.path(key), header + b'\n' + body.encode('utf-8'))
+    self.prune()
+
+  def remove_pages(self, stale):
+    for name in os.listdir(self.directory):
+      path = os.path.join(self.directory, name)
+      if name.endswith('.page') and stale(path):
+        try:
+          os.remove(path)
+        except OSError:
+          pass
+
+  def prune(self):
+    now = time.time()
+    if now - self.pruned_at < self.prune_interval:
+      return
+    self.pruned_at = now
+
+    def expired(path):
+      entry = self.read(path, header_only=True)
+      return entry is None or entry[0] <= now
+
+    self.remove_pages(expired)
+
+  def version(self):
+    try:
+      with open(os.path.join(self.directory, self.version_file)) as version:
+        return version.read()
+    except OSError:
+      return ''
+
+  def bump(self):
+    self.write(os.path.join(self.directory, self.version_file), uuid.uuid4().hex.encode('ascii'))
+    self.remove_pages(lambda path: True)
+
+
+'''
+PageCache
+    Flask extension caching rendered detail pages by endpoint and view
+    arguments (e.g. show_venue, venue_id=1) plus the data version, so a hot
+    page skips both the database and template rendering. Views that write
+    are decorated with invalidates and move the data version on; pages
+    also expire after PAGE_CACHE_TTL seconds, since shows move from
+    upcoming to past as time goes by. PAGE_CACHE_DIR selects a
+    FileSystemStore, otherwise pages live in a MemoryStore of
+    PAGE_CACHE_SIZE entries
+
+        page_cache = PageCache(app)
+
+        @page_cache.cached
+        def show_venue(venue_id): ...
+
+        @page_cache.invalidates
+        def create_venue_submission(): ...
+'''
+class PageCache:
+  def __init__(self, app=None, store=None):
+    self.store = store
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('PAGE_CACHE_TTL', PAGE_CACHE_TTL)
+    app.config.setdefault('PAGE_CACHE_SIZE', PAGE_CACHE_SIZE)
+    app.config.setdefault('PAGE_CACHE_DIR', None)
+    if self.store is None:
+      if app.config['PAGE_CACHE_DIR']:
+        self.store = FileSystemStore(app.config['PAGE_CACHE_DIR'])
+      else:
+        self.store = MemoryStore(app.config['PAGE_CACHE_SIZE'])
+    app.extensions['page_cache'] = self
+
+  def invalidate(self):
+    self.store.bump()
+
+  '''
+  cached(view)
+      decorator for GET views returning a rendered page; requests with
+      pending flash messages are rendered normally and not stored, the
+      layout shows those messages
+  '''
+  def cached(self, view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if request.method != 'GET' or session.get('_flashes'):
+        return view(*args, **kwargs)
+
+      # read the version before the view runs, so a write that lands while
+      # the page is rendered leaves it stored under an outdated key
+      key = '{}:{}:{}'.format(self.store.version(), request.endpoint,
+                              ','.join('{}={}'.format(name, value) for name, value in sorted(kwargs.items())))
+      entry = self.store.get(key)
+      if entry is not None and entry[0] > time.time():
+        return entry[1]
+
+      body = view(*args, **kwargs)
+      if isinstance(body, str):
+        self.store.set(key, (time.time() + current_app.config['PAGE_CACHE_TTL'], body))
+      return body
+
+    return wrapper
+
+  '''
+  invalidates(view)
+      decorator for views that create, edit or delete data: once the view
+      has run, every cached page is outdated
+  '''
+  def invalidates(self, view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      try:
+        return view(*args, **kwargs)
+      finally:
+        self.invalidate()
+
+    return wrapper
@@ -0,0 +1,189 @@
+import logging
+import threading
+
+from sqlalchemy import event, exc, false, func, literal_column, text
+
+logger = logging.getLogger(__name__)
+
+# most rows a search returns, first by name, once every criterion applied
+NAME_SEARCH_LIMIT = 500
+
+'''
+Name search backends
+    case-insensitive substring search on the name column of a model (Venue,
+    Artist), backed by a trigram index so "hop" finds "The Musical Hop"
+    without scanning every row
+
+        install(connection, models)   creates the indexes for the models
+        matches(model, term)          criterion selecting the rows whose name contains term
+
+    terms shorter than a trigram cannot use either index and fall back to
+    a plain LIKE on lower(name)
+'''
+
+'''
+name_trigrams(value)
+    every three character window of the lower-cased value
+'''
+def name_trigrams(value):
+  value = (value or '').lower()
+  return {value[i:i + 3] for i in range(len(value) - 2)}
+
+'''
+like_contains(value)
+    a LIKE pattern matching value anywhere, with its wildcards escaped
+'''
+def like_contains(value):
+  escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  return '%' + escaped + '%'
+
+def name_like(model, term):
+  return func.lower(model.name).like(like_contains(term.lower()), escape='\\')
+
+
+'''
+PostgresNameSearch
+    pg_trgm GIN index on lower(name) per table; the index serves LIKE
+    '%term%' directly, so matches() is the plain LIKE. If pg_trgm cannot
+    be installed the LIKE still works, as a sequential scan
+'''
+class PostgresNameSearch:
+  trigram_ddl = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS "ix_{table}_name_trgm" ON "{table}" '
+    'USING gin (lower(name) gin_trgm_ops)',
+  ]
+
+  def install(self, connection, models):
+    try:
+      with connection.begin_nested():
+        for model in models:
+          for statement in self.trigram_ddl:
+            connection.execute(text(statement.format(table=model.__tablename__)))
+    except exc.DBAPIError as error:
+      logger.warning('pg_trgm unavailable, name search scans the tables: %s', error)
+
+  def matches(self, model, term):
+    return name_like(model, term)
+
+
+'''
+TrigramIndex
+    lower-cased names by id and a trigram -> ids inverted index for one model
+'''
+class TrigramIndex:
+  def __init__(self):
+    self.names = {}
+    self.postings = {}
+
+  def add(self, row_id, name):
+    self.names[row_id] = (name or '').lower()
+    for trigram in name_trigrams(name):
+      self.postings.setdefault(trigram, set()).add(row_id)
+
+  def remove(self, row_id):
+    name = self.names.pop(row_id, None)
+    for trigram in name_trigrams(name):
+      self.postings[trigram].discard(row_id)
+
+  def find(self, term):
+    needle = term.lower()
+    candidates = None
+    for trigram in sorted(name_trigrams(needle), key=lambda trigram: len(self.postings.get(trigram, ()))):
+      candidates = self.postings.get(trigram, set()) if candidates is None \
+        else candidates & self.postings.get(trigram, set())
+      if not candidates:
+        return set()
+    # sharing every trigram does not make a substring ("abcxbcd" has all of
+    # "abcd"'s), so the candidates are checked against the names
+    return {row_id for row_id in candidates if needle in self.names[row_id]}
+
+
+'''
+NgramNameSearch
+    in-process fallback for databases without pg_trgm (SQLite test runs)
+    one TrigramIndex per model, built from its table on first use and
+    updated by mapper events on inserts, updates and deletes; matches()
+    turns the ids found into an IN criterion. The ids are written into the
+    statement as integer literals rather than bound, so a common term
+    matching thousands of names stays under SQLite's bound variable limit;
+    the location and genre criteria and the LIMIT apply in the same query
+'''
+class NgramNameSearch:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.indexes = {}
+
+  def install(self, connection, models):
+    for model in models:
+      if not event.contains(model, 'after_insert', self.on_write):
+        event.listen(model, 'after_insert', self.on_write)
+        event.listen(model, 'after_update', self.on_write)
+        event.listen(model, 'after_delete', self.on_delete)
+    # the indexes belong to one database, start over when installed again
+    self.reset()
+
+  def reset(self):
+    with self.lock:
+      self.indexes = {}
+
+  def index(self, model):
+    index = self.indexes.get(model)
+    if index is None:
+      index = TrigramIndex()
+      for row_id, name in model.query.with_entities(model.id, model.name):
+        index.add(row_id, name)
+      self.indexes[model] = index
+    return index
+
+  def matches(self, model, term):
+    if len(term) < 3:
+      return name_like(model, term)
+    with self.lock:
+      ids = self.index(model).find(term)
+    if not ids:
+      return false()
+    return model.id.in_([literal_column(str(int(row_id))) for row_id in sorted(ids)])
+
+  def on_write(self, mapper, connection, target):
+    with self.lock:
+      index = self.indexes.get(type(target))
+      if index is not None:
+        index.remove(target.id)
+        index.add(target.id, target.name)
+
+  def on_delete(self, mapper, connection, target):
+    with self.lock:
+      index = self.indexes.get(type(target))
+      if index is not None:
+        index.remove(target.id)
+
+
+ngram_name_search = NgramNameSearch()
+
+backends = {
+  'postgresql': PostgresNameSearch(),
+}
+
+'''
+name_search(bind)
+    returns the name search backend for the dialect of an engine or connection
+'''
+def name_search(bind):
+  return backends.get(bind.dialect.name, ngram_name_search)
+
+'''
+install_name_search(engine, models)
+    creates the name indexes of the engine's dialect for the given models
+'''
+def install_name_search(engine, models):
+  with engine.begin() as connection:
+    name_search(connection).install(connection, models)
+
+'''
+name_matches(model, term)
+    criterion selecting the model rows whose name contains term, ignoring case
+'''
+def name_matches(model, term):
+  bind = model.query.session.get_bind()
+  return name_search(bind).matches(model, term)
@@ -0,0 +1,109 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import app as fyyur
+from app import app, db, Artist, Show, Venue
+
+
+class VenueSearchTestCase(unittest.TestCase):
+    """This class represents the venue search test case, on a SQLite file"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory, 'fyyur.db')
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([Venue(name='Music Hall {:03d}'.format(number), city='New York', state='NY')
+                                for number in range(600)])
+            db.session.add_all([Venue(name='Music Zed {}'.format(number), city='San Francisco', state='CA')
+                                for number in range(3)])
+            db.session.commit()
+            fyyur.install_search()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+        shutil.rmtree(self.directory)
+
+    def search(self, **form):
+        # the result count and venue names from the rendered results page
+        page = self.client().post('/venues/search', data=form).get_data(as_text=True)
+        count = int(re.search(r'Number of search results for "[^"]*": (\d+)', page).group(1))
+        return count, re.findall(r'<h5>(.*?)</h5>', page)
+
+    def test_filtered_search_finds_hits_past_the_result_limit(self):
+        # the trigram and LIKE paths agree; the filter is applied before the limit
+        for term in ['music', 'mu']:
+            count, names = self.search(search_term=term, state='CA')
+
+            self.assertEqual(count, 3)
+            self.assertEqual(names, ['Music Zed 0', 'Music Zed 1', 'Music Zed 2'])
+
+    def test_search_returns_the_first_hits_by_name(self):
+        count, names = self.search(search_term='music')
+
+        self.assertEqual(count, fyyur.NAME_SEARCH_LIMIT)
+        self.assertEqual(names[0], 'Music Hall 000')
+
+
+class ShowPartitionsTestCase(unittest.TestCase):
+    """This class represents the past / upcoming show split test case, on a SQLite file"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory, 'fyyur.db')
+
+        with app.app_context():
+            db.create_all()
+            venue = Venue(name='The Musical Hop', city='San Francisco', state='CA')
+            artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+            db.session.add_all([venue, artist])
+            db.session.commit()
+            now = datetime.now()
+            db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id, start_time=now + timedelta(days=days))
+                                for days in (-3, -2, -1, 1, 2)])
+            db.session.commit()
+            self.venue_id = venue.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+        shutil.rmtree(self.directory)
+
+    def test_lists_are_limited_and_counts_are_not(self):
+        statements = []
+        listed = fyyur.SHOWS_LISTED
+        fyyur.SHOWS_LISTED = 2
+        with app.app_context():
+            count_statement = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', count_statement)
+            try:
+                shows = fyyur.show_partitions(Show.venue_id, self.venue_id, Artist)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count_statement)
+                fyyur.SHOWS_LISTED = listed
+
+        past = [show['start_time'] for show in shows['past_shows']]
+        upcoming = [show['start_time'] for show in shows['upcoming_shows']]
+        self.assertEqual(len(statements), 1)
+        self.assertEqual((shows['past_shows_count'], shows['upcoming_shows_count']), (3, 2))
+        self.assertEqual(len(past), 2)
+        self.assertEqual(past, sorted(past, reverse=True))
+        self.assertEqual(upcoming, sorted(upcoming))
+        self.assertTrue(past[0] < datetime.now() < upcoming[0])
+        self.assertEqual(shows['upcoming_shows'][0]['artist_name'], 'Guns N Petals')
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
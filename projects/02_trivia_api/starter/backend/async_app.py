@@ -0,0 +1,55 @@
+'''
+Cooperative build of the trivia API
+    the same flaskr routes, JSON contract and error handlers, run on gevent:
+    every request is a greenlet instead of a worker thread, and psycopg2 is
+    patched to yield to other greenlets while it waits on Postgres, so one
+    worker process keeps thousands of quiz players in flight. Connections
+    come from the 'threaded' pool profile unless DATABASE_POOL_PROFILE says
+    otherwise; requests beyond the pool queue for a connection
+
+    gevent and psycogreen (and gunicorn to deploy) are optional installs:
+
+        pip install gevent psycogreen gunicorn
+        gunicorn -k gevent --worker-connections 2000 -w 4 async_app:app
+        python async_app.py --port 5000
+'''
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import os
+
+try:
+  from psycogreen.gevent import patch_psycopg
+except ImportError:
+  patch_psycopg = None
+else:
+  patch_psycopg()
+
+from flaskr import create_app
+from models import db
+
+app = create_app({
+  'DATABASE_POOL_PROFILE': os.environ.get('DATABASE_POOL_PROFILE', 'threaded')
+})
+
+# only psycopg2 gets a cooperative wait callback; sqlite3 and unpatched
+# drivers hold the worker's event loop for the whole query
+if patch_psycopg is None or db.engine.dialect.name != 'postgresql':
+  app.logger.warning('database calls are not cooperative (%s%s), requests will block each other',
+                     db.engine.dialect.name, '' if patch_psycopg else ', psycogreen missing')
+
+
+def main():
+  from gevent.pywsgi import WSGIServer
+
+  parser = argparse.ArgumentParser(description='Serve the trivia API on gevent.')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=5000)
+  args = parser.parse_args()
+
+  WSGIServer((args.host, args.port), app, log=None).serve_forever()
+
+
+if __name__ == '__main__':
+  main()
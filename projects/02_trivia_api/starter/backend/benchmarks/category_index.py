@@ -0,0 +1,141 @@
+'''
+Category index benchmark
+
+Shows the query plans and timings of the category listing and quiz
+queries with the ix_questions_category_id / ix_questions_difficulty
+indexes, and again with them dropped. The indexes are recreated
+afterwards, so the database is left as it was. A quiz turn draws the
+question id in process (flaskr.quiz.quiz_question_ids) and reads that one
+question by primary key; the draw itself is timed separately.
+
+    python benchmarks/category_index.py --database-url postgres:///trivia_bench --seed 200000
+    python benchmarks/category_index.py --database-url sqlite:////tmp/trivia_bench.db --seed 200000
+
+--seed adds that many generated questions before measuring.
+'''
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from flaskr import create_app
+from flaskr.quiz import quiz_question_ids
+from models import db, Question, Category, database_path
+
+QUERIES = [
+  ('category page',
+   "SELECT id, question, answer, category, difficulty FROM questions "
+   "WHERE category = :category ORDER BY id LIMIT 20 OFFSET 0"),
+  ('category count',
+   "SELECT count(id) FROM questions WHERE category = :category"),
+  ('quiz question',
+   "SELECT id, question, answer, category, difficulty FROM questions "
+   "WHERE id = :question_id"),
+  ('difficulty page',
+   "SELECT id, question, answer, category, difficulty FROM questions "
+   "WHERE difficulty = :difficulty ORDER BY id LIMIT 20"),
+]
+
+INDEXES = [index for index in Question.__table__.indexes
+           if index.name in ('ix_questions_category_id', 'ix_questions_difficulty')]
+
+
+def seed(count, batch_size=10000):
+  category_ids = [category_id for category_id, in db.session.query(Category.id)]
+  if not category_ids:
+    for name in ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']:
+      db.session.add(Category(name))
+    db.session.commit()
+    category_ids = [category_id for category_id, in db.session.query(Category.id)]
+
+  insert = Question.__table__.insert()
+  for start in range(0, count, batch_size):
+    db.session.execute(insert, [{
+      'question': 'Generated question {}?'.format(number),
+      'answer': 'Answer {}'.format(number),
+      'category': random.choice(category_ids),
+      'difficulty': random.randint(1, 5)
+    } for number in range(start, min(start + batch_size, count))])
+    db.session.commit()
+
+
+def explain(connection, sql, params):
+  prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+  rows = connection.execute(text(prefix + sql), params).fetchall()
+  return [' '.join(str(column) for column in row) for row in rows]
+
+
+def measure(connection, sql, params, repeat):
+  timings = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    connection.execute(text(sql), params).fetchall()
+    timings.append((time.perf_counter() - started) * 1000)
+  return statistics.median(timings)
+
+
+def measure_draw(repeat):
+  # the first draw builds the id arrays, as the first quiz turn does
+  quiz_question_ids.draw(1, set())
+  timings = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    quiz_question_ids.draw(1, set())
+    timings.append((time.perf_counter() - started) * 1000)
+  return statistics.median(timings)
+
+
+def report(connection, label, params, repeat):
+  print('== {} =='.format(label))
+  for name, sql in QUERIES:
+    print('{:<16} {:>9.3f} ms'.format(name, measure(connection, sql, params, repeat)))
+    for line in explain(connection, sql, params):
+      print('    ' + line)
+  print()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--database-url', default=database_path)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--repeat', type=int, default=20)
+  args = parser.parse_args()
+
+  app = create_app({'DATABASE_PATH': args.database_url})
+
+  with app.app_context():
+    if args.seed:
+      seed(args.seed)
+
+    params = {
+      'category': 1,
+      'difficulty': 3,
+      'question_id': quiz_question_ids.draw(1, set()) or 0
+    }
+    print('{:<16} {:>9.3f} ms'.format('quiz id draw', measure_draw(args.repeat)))
+    print()
+
+    # each phase gets its own connection so no cached statement keeps an old plan
+    with db.engine.connect() as connection:
+      report(connection, 'with indexes', params, args.repeat)
+      for index in INDEXES:
+        index.drop(connection)
+
+    try:
+      with db.engine.connect() as connection:
+        report(connection, 'without indexes', params, args.repeat)
+    finally:
+      with db.engine.connect() as connection:
+        for index in INDEXES:
+          index.create(connection)
+
+
+if __name__ == '__main__':
+  main()
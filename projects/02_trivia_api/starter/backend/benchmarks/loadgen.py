@@ -0,0 +1,185 @@
+'''
+Minimal asyncio HTTP/1.1 load generator
+
+Virtual users keep one keep-alive connection each and send requests back
+to back; thousands of them fit in one process without threads or extra
+dependencies. Used by the scripts in this directory:
+
+    results = asyncio.run(run_users(url, users, duration, scenario))
+
+A scenario is a coroutine function scenario(client, user_number) that
+sends requests with client.request(...) until the run is over.
+'''
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+class HttpError(Exception):
+  pass
+
+
+class Client:
+  def __init__(self, url, results, deadline):
+    parts = urlsplit(url)
+    self.host = parts.hostname
+    self.port = parts.port or 80
+    self.results = results
+    self.deadline = deadline
+    self.reader = None
+    self.writer = None
+
+  @property
+  def running(self):
+    return time.perf_counter() < self.deadline
+
+  async def connect(self):
+    self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+  async def close(self):
+    if self.writer is not None:
+      self.writer.close()
+      try:
+        await self.writer.wait_closed()
+      except OSError:
+        pass
+      self.writer = None
+
+  async def send(self, method, path, body, content_type):
+    head = ['{} {} HTTP/1.1'.format(method, path),
+            'Host: {}:{}'.format(self.host, self.port),
+            'Connection: keep-alive']
+    if body is not None:
+      head += ['Content-Type: ' + content_type, 'Content-Length: {}'.format(len(body))]
+    self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + (body or b''))
+    await self.writer.drain()
+
+    status_line = await self.reader.readline()
+    if not status_line:
+      raise HttpError('connection closed by server')
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+      line = await self.reader.readline()
+      if line in (b'\r\n', b'\n', b''):
+        break
+      name, _, value = line.decode('latin-1').partition(':')
+      headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+      data = await self.reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+      data = b''
+      while True:
+        size = int((await self.reader.readline()).split(b';')[0], 16)
+        chunk = await self.reader.readexactly(size + 2)
+        if size == 0:
+          break
+        data += chunk[:-2]
+    else:
+      data = await self.reader.read()
+      await self.close()
+
+    connection = headers.get('connection', '').lower()
+    if connection == 'close' or (status_line.startswith(b'HTTP/1.0') and connection != 'keep-alive'):
+      await self.close()
+    return status, data
+
+  '''
+  request(label, method, path, payload, body, content_type)
+      sends payload as JSON, or a raw body of content_type, reconnecting
+      when the server dropped the connection, and records the latency
+      under label; returns (status, parsed JSON or None)
+  '''
+  async def request(self, label, method, path, payload=None, body=None,
+                    content_type='application/json'):
+    if payload is not None:
+      body = json.dumps(payload).encode('utf-8')
+    started = time.perf_counter()
+    try:
+      if self.writer is None:
+        await self.connect()
+      status, data = await self.send(method, path, body, content_type)
+    except (OSError, HttpError, asyncio.IncompleteReadError, ValueError, IndexError):
+      await self.close()
+      self.results.record(label, time.perf_counter() - started, None)
+      return None, None
+    self.results.record(label, time.perf_counter() - started, status)
+
+    try:
+      return status, json.loads(data) if data else None
+    except ValueError:
+      return status, None
+
+
+def percentile(ordered, fraction):
+  if not ordered:
+    return 0.0
+  return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Results:
+  def __init__(self):
+    self.latencies = {}
+    self.errors = {}
+    self.started = time.perf_counter()
+    self.finished = None
+
+  def record(self, label, seconds, status):
+    self.latencies.setdefault(label, []).append(seconds)
+    if status is None or status >= 500:
+      self.errors[label] = self.errors.get(label, 0) + 1
+
+  '''
+  summary()
+      per label: requests, errors (failed connections and 5xx), throughput
+      and p50/p95/p99/mean latency in milliseconds
+  '''
+  def summary(self):
+    elapsed = (self.finished or time.perf_counter()) - self.started
+    report = {}
+    for label, latencies in sorted(self.latencies.items()):
+      ordered = sorted(latencies)
+      report[label] = {
+        'requests': len(ordered),
+        'errors': self.errors.get(label, 0),
+        'throughput_rps': round(len(ordered) / elapsed, 1),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 2)
+      }
+    return report
+
+
+async def run_users(url, users, duration, scenario, ramp_up=1.0):
+  results = Results()
+  deadline = time.perf_counter() + duration
+
+  async def user(number):
+    # spread the connects over ramp_up seconds instead of one SYN burst
+    await asyncio.sleep(ramp_up * number / max(users, 1))
+    client = Client(url, results, deadline)
+    try:
+      while client.running:
+        await scenario(client, number)
+    finally:
+      await client.close()
+
+  await asyncio.gather(*(user(number) for number in range(users)))
+  results.finished = time.perf_counter()
+  return results
+
+
+def print_summary(title, summary):
+  print('== {} =='.format(title))
+  print('{:<44} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+    'endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+  for label, row in summary.items():
+    print('{:<44} {:>8} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+      label, row['requests'], row['errors'], row['throughput_rps'],
+      row['p50_ms'], row['p95_ms'], row['p99_ms']))
+  print()
@@ -0,0 +1,79 @@
+'''
+Quiz traffic load test
+
+Simulates concurrent quiz players against one or more running servers and
+prints throughput and latency per concurrency level. Each player plays
+five-question quizzes back to back on one keep-alive connection, resending
+its previous_questions like the frontend does.
+
+Start the thread-per-request and the gevent build side by side, e.g.
+
+    gunicorn -w 4 --threads 8 -b 127.0.0.1:5000 'flaskr:create_app()'
+    gunicorn -k gevent --worker-connections 2000 -w 4 -b 127.0.0.1:5001 async_app:app
+
+then compare them:
+
+    python benchmarks/quiz_load.py --target sync=http://127.0.0.1:5000 \\
+        --target gevent=http://127.0.0.1:5001 --users 50 500 2000 --duration 20
+'''
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import print_summary, run_users
+
+QUESTIONS_PER_QUIZ = 5
+
+
+def quiz_scenario(category_ids):
+  async def play(client, user_number):
+    category = random.choice(category_ids + ['click'])
+    previous = []
+    for _ in range(QUESTIONS_PER_QUIZ):
+      if not client.running:
+        return
+      status, data = await client.request('POST /quizzes', 'POST', '/quizzes', {
+        'previous_questions': previous,
+        'quiz_category': {'type': category, 'id': category}
+      })
+      if status != 200 or not data or not data.get('question'):
+        return
+      previous.append(data['question']['id'])
+  return play
+
+
+async def load_categories(url):
+  category_ids = []
+
+  async def fetch(client, user_number):
+    _, data = await client.request('GET /categories', 'GET', '/categories')
+    category_ids.extend((data or {}).get('categories') or [])
+    client.deadline = 0
+
+  await run_users(url, 1, 5, fetch, ramp_up=0)
+  return category_ids
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--target', action='append', required=True,
+                      help='name=url of a running server, may be repeated')
+  parser.add_argument('--users', type=int, nargs='+', default=[50, 500])
+  parser.add_argument('--duration', type=float, default=15)
+  args = parser.parse_args()
+
+  targets = [target.split('=', 1) for target in args.target]
+  for name, url in targets:
+    category_ids = asyncio.run(load_categories(url))
+    for users in args.users:
+      results = asyncio.run(run_users(url, users, args.duration, quiz_scenario(category_ids)))
+      print_summary('{} / {} players'.format(name, users), results.summary())
+
+
+if __name__ == '__main__':
+  main()
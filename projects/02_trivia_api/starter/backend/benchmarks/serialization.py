@@ -0,0 +1,101 @@
+'''
+Question serialization microbenchmark
+
+Compares turning N questions into a JSON body through ORM objects
+(Question.query.all() + Question.format() + json.dumps) with the column
+projection used by the endpoints (question_rows + format_question_rows),
+with the standard library encoder and with orjson when it is installed.
+
+    python benchmarks/serialization.py
+    python benchmarks/serialization.py --sizes 10000 100000 --database-url postgres:///trivia_bench
+
+The questions table is filled up to the largest size first; the timings
+read the first N rows ordered by id.
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import create_app
+from flaskr import serialization
+from flaskr.serialization import format_question_rows, question_rows
+from models import db, Question, Category
+
+
+def seed(count, batch_size=10000):
+  if not db.session.query(Category.id).first():
+    db.session.add(Category('Science'))
+    db.session.commit()
+  category_id = db.session.query(Category.id).scalar()
+
+  existing = Question.query.count()
+  insert = Question.__table__.insert()
+  for start in range(existing, count, batch_size):
+    db.session.execute(insert, [{
+      'question': 'Generated question {}?'.format(number),
+      'answer': 'Answer {}'.format(number),
+      'category': category_id,
+      'difficulty': number % 5 + 1
+    } for number in range(start, min(start + batch_size, count))])
+    db.session.commit()
+
+
+def orm_path(size):
+  questions = Question.query.order_by(Question.id).limit(size).all()
+  body = json.dumps([question.format() for question in questions]).encode('utf-8')
+  db.session.expunge_all()
+  return body
+
+
+def projection_path(size):
+  rows = question_rows(Question.query).order_by(Question.id).limit(size).all()
+  return json.dumps(format_question_rows(rows)).encode('utf-8')
+
+
+def projection_fast_path(size):
+  rows = question_rows(Question.query).order_by(Question.id).limit(size).all()
+  return serialization.dumps(format_question_rows(rows))
+
+
+def measure(path, size, repeat):
+  timings = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    path(size)
+    timings.append((time.perf_counter() - started) * 1000)
+  return statistics.median(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--database-url', default='sqlite:////tmp/trivia_serialization.db')
+  parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  paths = [('orm + format()', orm_path), ('column projection', projection_path)]
+  if serialization.orjson is not None:
+    paths.append(('projection + orjson', projection_fast_path))
+
+  app = create_app({'DATABASE_PATH': args.database_url})
+  with app.app_context():
+    seed(max(args.sizes))
+
+    for size in args.sizes:
+      baseline = None
+      print('== {} rows =='.format(size))
+      for name, path in paths:
+        elapsed = measure(path, size, args.repeat)
+        baseline = baseline or elapsed
+        print('{:<22} {:>10.1f} ms  {:>5.2f}x'.format(name, elapsed, baseline / elapsed))
+      print()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,323 @@
+'''
+Trivia API benchmark suite
+
+Seeds a local database to the requested volume, serves the app from a
+threaded server in this process and drives every endpoint in turn with
+the asyncio load generator. Per endpoint it reports requests, errors,
+throughput, p50/p95/p99 latency, and the SQL statements and database time
+per request, counted from SQLAlchemy engine events. Results are written
+as JSON so runs on different commits can be diffed:
+
+    python benchmarks/suite.py --questions 100000 --categories 12 --output before.json
+    git checkout other-branch
+    python benchmarks/suite.py --questions 100000 --categories 12 --output after.json --baseline before.json
+
+--database-url picks the database (a SQLite file by default, e.g.
+postgres:///trivia_bench for Postgres); seeding only tops the tables up,
+so repeated runs reuse the data. Writes (create, delete, import) run last
+and delete what they created, but imported rows stay.
+'''
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from flaskr import create_app
+from flaskr.duplicates import ngram_duplicates
+from loadgen import print_summary, run_users
+from models import db, replicas, Question, Category
+
+WORDS = ['{}{}'.format(consonant, vowel) * 2 + ending
+         for consonant in 'bdfgklmnprstvz' for vowel in 'aeiou' for ending in ('', 'n', 'x')]
+
+
+def sentence(generator, words=8):
+  return ' '.join(generator.sample(WORDS, words)).capitalize() + '?'
+
+
+def seed(questions, categories, generator, batch_size=10000):
+  existing = db.session.query(Category.id).count()
+  for number in range(existing, categories):
+    db.session.add(Category('Category {}'.format(number + 1)))
+  db.session.commit()
+  category_ids = [category_id for category_id, in db.session.query(Category.id)]
+
+  insert = Question.__table__.insert()
+  existing = Question.query.count()
+  for start in range(existing, questions, batch_size):
+    db.session.execute(insert, [{
+      'question': sentence(generator),
+      'answer': generator.choice(WORDS),
+      'category': generator.choice(category_ids),
+      'difficulty': generator.randint(1, 5)
+    } for _ in range(start, min(start + batch_size, questions))])
+    db.session.commit()
+  ngram_duplicates.reset()
+  return category_ids
+
+
+'''
+QueryCounter
+    counts the statements and database time of every request by
+    "<METHOD> <url rule>"; load generator labels are that key, optionally
+    followed by a " (variant)" suffix
+'''
+class QueryCounter:
+  def __init__(self, engines):
+    self.lock = threading.Lock()
+    self.local = threading.local()
+    self.statements = {}
+    self.seconds = {}
+    for engine in engines:
+      event.listen(engine, 'before_cursor_execute', self.before)
+      event.listen(engine, 'after_cursor_execute', self.after)
+
+  def label(self):
+    if not has_request_context() or request.url_rule is None:
+      return None
+    return '{} {}'.format(request.method, request.url_rule.rule)
+
+  def before(self, connection, cursor, statement, parameters, context, executemany):
+    self.local.started = time.perf_counter()
+
+  def after(self, connection, cursor, statement, parameters, context, executemany):
+    label = self.label()
+    if label is None:
+      return
+    elapsed = time.perf_counter() - getattr(self.local, 'started', time.perf_counter())
+    with self.lock:
+      self.statements[label] = self.statements.get(label, 0) + 1
+      self.seconds[label] = self.seconds.get(label, 0.0) + elapsed
+
+  def reset(self):
+    with self.lock:
+      self.statements = {}
+      self.seconds = {}
+
+
+'''
+Scenarios
+    one per endpoint; each is a coroutine function (client, user number)
+    sending one request, or a short sequence, labelled by the url rule
+'''
+def scenarios(category_ids, total_questions, generator):
+  pages = max(1, total_questions // 20)
+  created = []
+
+  async def list_categories(client, user):
+    await client.request('GET /categories', 'GET', '/categories')
+
+  async def category_stats(client, user):
+    await client.request('GET /categories/stats', 'GET', '/categories/stats')
+
+  async def list_questions(client, user):
+    await client.request('GET /questions', 'GET', '/questions?page={}'.format(generator.randint(1, pages)))
+
+  async def cursor_questions(client, user):
+    await client.request('GET /questions (cursor)', 'GET', '/questions?limit=20')
+
+  async def category_questions(client, user):
+    await client.request('GET /categories/<int:category_id>/questions', 'GET',
+                         '/categories/{}/questions'.format(generator.choice(category_ids)))
+
+  async def search(client, user):
+    await client.request('POST /questions', 'POST', '/questions',
+                         {'searchTerm': generator.choice(WORDS)})
+
+  async def export(client, user):
+    await client.request('GET /questions/export', 'GET',
+                         '/questions/export?category={}'.format(generator.choice(category_ids)))
+
+  async def quiz(client, user):
+    previous = []
+    category = generator.choice(category_ids)
+    for _ in range(5):
+      status, data = await client.request('POST /quizzes', 'POST', '/quizzes', {
+        'previous_questions': previous,
+        'quiz_category': {'type': category, 'id': category}
+      })
+      if status != 200 or not data or not data.get('question'):
+        return
+      previous.append(data['question']['id'])
+
+  async def quiz_session(client, user):
+    category = generator.choice(category_ids)
+    status, data = await client.request('POST /quizzes/sessions', 'POST', '/quizzes/sessions', {
+      'quiz_category': {'type': category, 'id': category}
+    })
+    if status != 201:
+      return
+    for _ in range(5):
+      await client.request('POST /quizzes/sessions/<session_id>/next', 'POST',
+                           '/quizzes/sessions/{}/next'.format(data['session_id']))
+
+  async def pool(client, user):
+    await client.request('GET /internal/pool', 'GET', '/internal/pool')
+
+  async def create(client, user):
+    status, data = await client.request('POST /questions/create', 'POST', '/questions/create', {
+      'question': sentence(generator, 10),
+      'answer': generator.choice(WORDS),
+      'category': generator.choice(category_ids),
+      'difficulty': generator.randint(1, 5)
+    })
+    if status == 201:
+      created.append(data['created'])
+
+  async def delete(client, user):
+    if not created:
+      client.deadline = 0
+      return
+    await client.request('DELETE /questions/<int:question_id>/delete', 'DELETE',
+                         '/questions/{}/delete'.format(created.pop()))
+
+  async def bulk_import(client, user):
+    rows = [json.dumps({
+      'question': sentence(generator, 10),
+      'answer': generator.choice(WORDS),
+      'category': generator.choice(category_ids),
+      'difficulty': generator.randint(1, 5)
+    }) for _ in range(100)]
+    await client.request('POST /questions/import', 'POST', '/questions/import',
+                         body='\n'.join(rows).encode('utf-8'), content_type='application/x-ndjson')
+
+  return [
+    ('categories', list_categories),
+    ('category-stats', category_stats),
+    ('questions', list_questions),
+    ('questions-cursor', cursor_questions),
+    ('category-questions', category_questions),
+    ('search', search),
+    ('export', export),
+    ('quiz', quiz),
+    ('quiz-session', quiz_session),
+    ('pool', pool),
+    ('create', create),
+    ('delete', delete),
+    ('import', bulk_import),
+  ]
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+  # keep-alive connections, and no access log line per request
+  protocol_version = 'HTTP/1.1'
+
+  def setup(self):
+    super().setup()
+    # headers and body go out in separate writes; without this, Nagle's
+    # algorithm and delayed ACKs add ~40 ms to every response
+    self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+  def log_request(self, *args, **kwargs):
+    pass
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                   cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def compare(results, baseline):
+  print('== change against baseline ({}) =='.format((baseline['meta'].get('commit') or '?')[:12]))
+  print('{:<44} {:>12} {:>12} {:>12}'.format('endpoint', 'p95 ms', 'req/s', 'queries/req'))
+  for label, row in results['endpoints'].items():
+    before = baseline['endpoints'].get(label)
+    if before is None:
+      continue
+    print('{:<44} {:>+12.2f} {:>+12.1f} {:>+12.2f}'.format(
+      label, row['p95_ms'] - before['p95_ms'],
+      row['throughput_rps'] - before['throughput_rps'],
+      row['queries_per_request'] - before['queries_per_request']))
+  print()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--database-url', default='sqlite:////tmp/trivia_suite.db')
+  parser.add_argument('--questions', type=int, default=1000, help='1k to 1M')
+  parser.add_argument('--categories', type=int, default=6)
+  parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+  parser.add_argument('--duration', type=float, default=10, help='seconds per endpoint')
+  parser.add_argument('--only', nargs='+', help='run only these scenarios')
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--output', default='benchmark-results.json')
+  parser.add_argument('--baseline', help='earlier results file to compare with')
+  args = parser.parse_args()
+
+  generator = random.Random(args.seed)
+  app = create_app({'DATABASE_PATH': args.database_url})
+  with app.app_context():
+    category_ids = seed(args.questions, args.categories, generator)
+    total_questions = Question.query.count()
+    dialect = db.engine.dialect.name
+    counter = QueryCounter([db.engine] + replicas.engines())
+
+  server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+  results = {
+    'meta': {
+      'commit': git_commit(),
+      'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+      'database': dialect,
+      'questions': total_questions,
+      'categories': len(category_ids),
+      'users': args.users,
+      'duration': args.duration,
+      'python': platform.python_version()
+    },
+    'endpoints': {}
+  }
+
+  try:
+    for name, scenario in scenarios(category_ids, total_questions, generator):
+      if args.only and name not in args.only:
+        continue
+      counter.reset()
+      run = asyncio.run(run_users(url, args.users, args.duration, scenario))
+      summary = run.summary()
+      for label, row in summary.items():
+        rule = label.split(' (')[0]
+        row['queries_per_request'] = round(counter.statements.get(rule, 0) / row['requests'], 2)
+        row['db_ms_per_request'] = round(counter.seconds.get(rule, 0.0) * 1000 / row['requests'], 3)
+        results['endpoints'][label] = row
+      print_summary(name, summary)
+  finally:
+    server.shutdown()
+
+  print('{:<44} {:>12} {:>12}'.format('endpoint', 'queries/req', 'db ms/req'))
+  for label, row in results['endpoints'].items():
+    print('{:<44} {:>12.2f} {:>12.3f}'.format(label, row['queries_per_request'], row['db_ms_per_request']))
+  print()
+
+  with open(args.output, 'w') as output:
+    json.dump(results, output, indent=2, sort_keys=True)
+  print('results written to {}'.format(args.output))
+
+  if args.baseline:
+    with open(args.baseline) as baseline:
+      compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+  main()
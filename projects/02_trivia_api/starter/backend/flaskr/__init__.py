@@ -2,16 +2,43 @@ import os
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
-
-from models import setup_db, Question, Category
+from flask_migrate import Migrate
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import setup_db, db, database_path, pool_metrics, replica_reads, replicas, Question
+from .pagination import paginate_questions, questions_page
+from .query_stats import QueryStats
+from .quiz import previous_question_ids, quiz_category_id, quiz_question_ids, random_question
+from .quiz_sessions import next_session_question, quiz_store_from_env, shuffled_deck
+from .bulk_import import IMPORT_BATCH_SIZE, import_questions, import_questions_command, ndjson_rows
+from .categories import category_cache, category_question_counts
+from .duplicates import find_duplicate_question, install_duplicate_detection
+from .response_cache import ResponseCache
+from .search import install_search, search_questions_query
+from .streaming import requested_stream_format, stream_questions
 
 QUESTIONS_PER_PAGE = 20
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  if test_config is not None:
+    app.config.from_mapping(test_config)
+  setup_db(app, app.config.get('DATABASE_PATH', database_path))
+  # schema changes live in migrations/, run them with `flask db upgrade`
+  Migrate(app, db, render_as_batch=True)
+  # PostgreSQL's search and duplicate indexes come from the migrations; on
+  # SQLite these set up the FTS5 table, its triggers and the ngram index
+  install_search(db.engine)
+  install_duplicate_detection(db.engine)
+  quiz_question_ids.reset()
+
+  quiz_sessions = app.config.get('QUIZ_SESSION_STORE') or quiz_store_from_env()
+  app.cli.add_command(import_questions_command)
+
+  response_cache = ResponseCache(max_age=app.config.get('RESPONSE_CACHE_MAX_AGE', 0))
+  # Server-Timing headers, N+1 warnings and slow request reports
+  QueryStats(app)
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -28,24 +55,58 @@ def create_app(test_config=None):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+  '''
+  Pool metrics: GET /internal/pool reports live connection pool figures of
+  every engine (checked out connections, overflow, checkout waits). Keep
+  /internal off the public proxy.
+  '''
+  @app.route('/internal/pool')
+  def get_pool_metrics():
+    pools = {'primary': pool_metrics(db.engine)}
+    for number, engine in enumerate(replicas.engines()):
+      pools['replica-{}'.format(number)] = pool_metrics(engine)
+
+    return jsonify({
+      'success': True,
+      'pools': pools
+    }), 200
+
   '''
   @TODO: 
   Create an endpoint to handle GET requests 
   for all available categories.
   '''
   @app.route('/categories')
+  @response_cache.cached
+  @replica_reads
   def get_all_categories():
-    categories = Category.query.order_by(Category.id).all()
-    data = [category.id for category in categories]
+    categories, etag = category_cache.get()
+    data = [category['id'] for category in categories]
 
     if data is None:
         abort(404)
     else:
-        return jsonify({
+        response = jsonify({
             'success': True,
             'categories': data,
             'total_questions': len(categories)
-        }), 200
+        })
+        # answers If-None-Match with a 304 straight from the cache
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+  @app.route('/categories/stats')
+  @response_cache.cached
+  @replica_reads
+  def get_category_stats():
+    stats = category_question_counts()
+
+    return jsonify({
+        'success': True,
+        'categories': stats,
+        'total_questions': sum(category['total_questions'] for category in stats)
+    }), 200
+
   '''
   @TODO: 
   Create an endpoint to handle GET requests for questions, 
@@ -58,35 +119,44 @@ def create_app(test_config=None):
   ten questions per page and pagination at the bottom of the screen for three pages.
   Clicking on the page numbers should update the questions. 
   '''
-  def question_pagination(request, collection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1)*QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    
-    f_questions = [question.format() for question in collection]
-
-    return f_questions[start:end]
-
   @app.route('/questions')
+  @response_cache.cached
+  @replica_reads
   def get_questions():
-    categories = Category.query.order_by(Category.id).all()
-    data = [category.id for category in categories]
+    data = category_cache.ids()
     # current_category = request.args.get('category', 1, type=int)
 
-    questions = Question.query.all()
-    f_questions = question_pagination(request, questions)
+    stream_format = requested_stream_format(request)
+    if stream_format:
+      return stream_questions(Question.query, stream_format)
+
+    page = questions_page(request, Question.query, QUESTIONS_PER_PAGE)
 
     if data is None:
         abort(404) 
     else:
         return jsonify({
             'success': True,
-            'questions': f_questions,
             'current_category': 1,
             'categories': data,
-            'total_questions': len(f_questions)
+            **page
         }), 200
 
+  '''
+  Export: GET /questions/export streams every question, optionally only
+  those of ?category=, as NDJSON (default) or as one JSON document with
+  ?format=json-stream.
+  '''
+  @app.route('/questions/export')
+  @replica_reads
+  def export_questions():
+    questions = Question.query
+    category_id = request.args.get('category', None, type=int)
+    if category_id is not None:
+      questions = questions.filter(Question.category == category_id)
+
+    return stream_questions(questions, requested_stream_format(request, 'ndjson'))
+
   '''
   @TODO: 
   Create an endpoint to DELETE question using a question ID. 
@@ -96,16 +166,20 @@ def create_app(test_config=None):
   '''
   @app.route('/questions/<int:question_id>/delete', methods=['DELETE'])
   def delete_question(question_id):
+    question = Question.query.get(question_id)
+    if question is None:
+      abort(404)
+
     try:
-        question = Question.query.get(question_id)
         question.delete()
         return jsonify({        
         'success': True,
         'status': 200,
         'deleted': question.id
         }), 200
-    except:
-        abort(404)
+    except SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
   '''
   @TODO: 
   Create an endpoint to POST a new question, 
@@ -120,44 +194,67 @@ def create_app(test_config=None):
   @app.route('/questions/create', methods=['POST'])
   def add_question():
     data = request.get_json()
+    if not isinstance(data, dict):
+      abort(400)
 
-    question = data.get('question', None),
-    answer = data.get('answer', None),
-    difficulty = data.get('difficulty', None),
+    question = data.get('question', None)
+    answer = data.get('answer', None)
+    difficulty = data.get('difficulty', None)
     category = data.get('category', None)
 
+    if not question or not answer:
+      abort(400)
+
+    #check if question already exists
+    duplicate = find_duplicate_question(question)
+    if duplicate is not None:
+      return jsonify({
+          'success': False,
+          'status': 422,
+          'message': f'{question} already exists',
+          'duplicate_of': duplicate.id
+      }), 422
+
     try:
-      #check if question already exists
-      results = Question.query.filter(Question.question.ilike(f'%{question}%')).all()
-      if results:
+      question = Question(
+        question=question,
+        answer=answer, 
+        difficulty=difficulty,
+        category=category)
 
-        return jsonify({
-            'success': False,
-            'status': 422,
-            'message': f'{question} already exists',
-        }), 422
-
-      else:
-        question = Question(
-          question=question,
-          answer=answer, 
-          difficulty=difficulty,
-          category=category)
-
-        question.insert()
-
-        categories = Category.query.order_by(Category.id).all()
-        data = [category.id for category in categories]
-          
-        return jsonify({
-          'success': True,
-          'status': 201,
-          'question': question.format(),
-          'created': question.id,
-          'categories': data
-        }), 201
-    except:
-      abort(400)  
+      question.insert()
+
+      data = category_cache.ids()
+        
+      return jsonify({
+        'success': True,
+        'status': 201,
+        'question': question.format(),
+        'created': question.id,
+        'categories': data
+      }), 201
+    except SQLAlchemyError:
+      db.session.rollback()
+      abort(400)
+
+  '''
+  Bulk import: POST /questions/import takes an NDJSON body, one question
+  object per line, and inserts it in batches of ?batch_size= rows. Rows
+  that fail are reported by line number; the rest are kept.
+  The same loader is available as `flask import-questions PATH`.
+  '''
+  @app.route('/questions/import', methods=['POST'])
+  def bulk_import_questions():
+    batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
+    if batch_size < 1:
+      abort(400)
+
+    report = import_questions(ndjson_rows(request.stream), batch_size)
+
+    return jsonify({
+        'success': True,
+        **report.format()
+    }), 200
 
   '''
   @TODO: 
@@ -170,30 +267,40 @@ def create_app(test_config=None):
   Try using the word "title" to start. 
   '''
   @app.route('/questions', methods=['POST'])
+  @replica_reads
   def search_questions():
 
     data = request.get_json()
+    if not isinstance(data, dict):
+      abort(400)
     search = data.get('searchTerm', None)
     current_category =request.args.get('category', 1, type=int)
 
+    # HTTP errors raised while paginating (400 for a bad page) pass through
     try:
-      results = Question.query.order_by(Question.id).filter(Question.question.ilike(f'%{search}%')).all()
-      f_questions = question_pagination(request, results)
+      results = search_questions_query(Question.query, search)
+
+      stream_format = requested_stream_format(request)
+      if stream_format:
+        return stream_questions(results, stream_format)
 
+      f_questions, total_questions = paginate_questions(
+        request, results, QUESTIONS_PER_PAGE)
 
-      categories = Category.query.order_by(Category.id).all()
-      cat_data = [category.format() for category in categories]
+
+      cat_data = category_cache.formatted()
       
       return jsonify({
           'success': True,
           'questions': f_questions,
           'current_category ': current_category,
-          'total_questions': len(f_questions),
+          'total_questions': total_questions,
           'categories': cat_data
       }), 200
 
-    except:
-      abort(404)
+    except SQLAlchemyError:
+      db.session.rollback()
+      abort(422)
 
   '''
   @TODO: 
@@ -204,19 +311,24 @@ def create_app(test_config=None):
   category to be shown. 
   '''
   @app.route('/categories/<int:category_id>/questions')
+  @response_cache.cached
+  @replica_reads
   def get_category_questions(category_id):
-    questions = Question.query.filter(Question.category == category_id).all()
+    questions = Question.query.filter(Question.category == category_id)
+
+    stream_format = requested_stream_format(request)
+    if stream_format:
+      return stream_questions(questions, stream_format)
     
-    f_questions = question_pagination(request, questions)
+    page = questions_page(request, questions, QUESTIONS_PER_PAGE)
 
-    if f_questions is None:
+    if page['questions'] is None:
         abort(404) 
     else:
         return jsonify({
             'success': True,
-            'questions': f_questions,
             'current_category': category_id,
-            'total_questions': len(f_questions)
+            **page
         }), 200
 
   '''
@@ -231,40 +343,60 @@ def create_app(test_config=None):
   and shown whether they were correct or not. 
   '''
   @app.route('/quizzes', methods=['POST'])
+  @replica_reads
   def get_quiz_questions():
     data = request.get_json()
-    previous_questions = data.get('previous_questions', [1]),
-    quiz_category  = data.get('quiz_category', None),
+    if not isinstance(data, dict):
+      abort(400)
 
-    if(quiz_category[0].get('type') == 'click'):
-      questions = Question.query.order_by(Question.id).all()
-    else:
-      questions = Question.query.filter(Question.category == quiz_category[0].get('type')).all()
+    previous_questions = previous_question_ids(data.get('previous_questions', []))
+    quiz_category = data.get('quiz_category', None)
 
-    question_bank = [question.format() for question in questions]
+    question = random_question(quiz_category_id(quiz_category), previous_questions)
 
-    if question_bank is None:
-        abort(404) 
-    else:
-      
-      # Now find a unique question that hasn't been asked and return to user
-      quiz_list = [x for x in question_bank if x.get('id') not in previous_questions[0] ]
+    return jsonify({
+        'success': True,
+        'question': question.format() if question else None,
+        'current_category': quiz_category,
+    }), 200
 
-      #return a random question to the user
-      try:
-        quiz = quiz_list[random.randrange(0, (len(quiz_list) - 1))]
+  '''
+  Quiz sessions: POST /quizzes/sessions shuffles the question ids of the
+  chosen category once and stores the deck server side. Each
+  POST /quizzes/sessions/<session_id>/next pops the next question, so
+  the client does not resend previous_questions on every turn.
+  '''
+  @app.route('/quizzes/sessions', methods=['POST'])
+  @replica_reads
+  def start_quiz_session():
+    data = request.get_json()
+    if not isinstance(data, dict):
+      abort(400)
 
-        return jsonify({
-            'success': True,
-            'question': quiz,
-            'current_category': quiz_category,
-        }), 200
-      except:
-        return jsonify({
-            'success': True,
-            'question': None,
-            'current_category': quiz_category,
-        }), 200
+    quiz_category = data.get('quiz_category', None)
+    deck = shuffled_deck(quiz_category_id(quiz_category))
+    session_id = quiz_sessions.create(quiz_category, deck)
+
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'total_questions': len(deck),
+        'current_category': quiz_category,
+    }), 201
+
+  @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+  @replica_reads
+  def next_quiz_question(session_id):
+    try:
+      quiz_category, question = next_session_question(quiz_sessions, session_id)
+    except KeyError:
+      abort(404)
+
+    return jsonify({
+        'success': True,
+        'question': question.format() if question else None,
+        'current_category': quiz_category,
+    }), 200
 
   '''
   @TODO: 
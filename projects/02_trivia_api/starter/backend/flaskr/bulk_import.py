@@ -0,0 +1,218 @@
+import csv
+import io
+import json
+import os
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import exc
+
+from models import db, data_version, Question, Category
+from .duplicates import ngram_duplicates
+
+IMPORT_BATCH_SIZE = 1000
+# at most this many row errors are listed in an import report
+MAX_REPORTED_ERRORS = 100
+# the header row of a CSV import must name each of these columns
+CSV_COLUMNS = ('question', 'answer', 'difficulty', 'category')
+
+'''
+Bulk question import
+    rows are streamed from NDJSON or CSV input, validated and inserted in
+    batches with one executemany INSERT and one commit per batch; rows that
+    fail validation or the insert are reported by line number and skipped,
+    the rest of the load carries on
+
+    each row carries question, answer, difficulty (1-5) and category (a category id)
+'''
+
+'''
+ndjson_rows(lines)
+    yields (line number, row dict or None, error or None) for NDJSON input
+    lines may be str or bytes; blank lines are skipped and lines that are
+    not valid UTF-8 are reported like malformed JSON
+'''
+def ndjson_rows(lines):
+  for line_number, line in enumerate(lines, start=1):
+    if isinstance(line, bytes):
+      try:
+        line = line.decode('utf-8')
+      except UnicodeDecodeError as error:
+        yield line_number, None, 'invalid UTF-8: {}'.format(error)
+        continue
+    if not line.strip():
+      continue
+    try:
+      row = json.loads(line)
+    except ValueError as error:
+      yield line_number, None, 'invalid JSON: {}'.format(error)
+      continue
+    if not isinstance(row, dict):
+      yield line_number, None, 'expected a JSON object'
+      continue
+    yield line_number, row, None
+
+'''
+decoded_lines(lines, bad_lines)
+    decodes bytes lines as UTF-8, replacing undecodable bytes and adding
+    the line number to bad_lines; str lines pass through
+'''
+def decoded_lines(lines, bad_lines):
+  for line_number, line in enumerate(lines, start=1):
+    if isinstance(line, bytes):
+      try:
+        line = line.decode('utf-8')
+      except UnicodeDecodeError:
+        bad_lines.add(line_number)
+        line = line.decode('utf-8', 'replace')
+    yield line
+
+'''
+csv_rows(lines)
+    yields (line number, row dict or None, error or None) for CSV input
+    with a header row; lines may be str or bytes, and a row spanning a
+    line that is not valid UTF-8 is reported instead of imported
+    input whose first row does not name CSV_COLUMNS (no header, or an
+    empty file) is reported as one error and nothing is imported
+'''
+def csv_rows(lines):
+  bad_lines = set()
+  reader = csv.DictReader(decoded_lines(lines, bad_lines))
+  # reads the header row, so line_num below starts after it
+  header = reader.fieldnames or []
+  missing = [column for column in CSV_COLUMNS if column not in header]
+  if missing:
+    yield max(reader.line_num, 1), None, 'header row is missing {}'.format(', '.join(missing))
+    return
+  previous = reader.line_num
+  for row in reader:
+    bad = {line_number for line_number in bad_lines if line_number <= reader.line_num}
+    bad_lines -= bad
+    if any(line_number > previous for line_number in bad):
+      yield reader.line_num, None, 'invalid UTF-8'
+    else:
+      yield reader.line_num, row, None
+    previous = reader.line_num
+
+def validate_row(row, category_ids):
+  question = row.get('question')
+  answer = row.get('answer')
+  if not isinstance(question, str) or not question.strip():
+    return None, 'question is required'
+  if not isinstance(answer, str) or not answer.strip():
+    return None, 'answer is required'
+
+  try:
+    difficulty = int(row.get('difficulty'))
+    category = int(row.get('category'))
+  except (TypeError, ValueError):
+    return None, 'difficulty and category must be integers'
+  if not 1 <= difficulty <= 5:
+    return None, 'difficulty must be between 1 and 5'
+  if category not in category_ids:
+    return None, 'unknown category {}'.format(category)
+
+  return {
+    'question': question.strip(),
+    'answer': answer.strip(),
+    'difficulty': difficulty,
+    'category': category
+  }, None
+
+'''
+ImportReport
+    counts inserted rows and keeps the first MAX_REPORTED_ERRORS row errors
+'''
+class ImportReport:
+  def __init__(self):
+    self.inserted = 0
+    self.failed = 0
+    self.errors = []
+
+  def error(self, line_number, message):
+    self.failed += 1
+    if len(self.errors) < MAX_REPORTED_ERRORS:
+      self.errors.append({'line': line_number, 'error': message})
+
+  def format(self):
+    return {
+      'inserted': self.inserted,
+      'failed': self.failed,
+      'errors': self.errors
+    }
+
+def insert_batch(batch, report):
+  insert = Question.__table__.insert()
+  try:
+    db.session.execute(insert, [values for _, values in batch])
+    db.session.commit()
+    data_version.bump()
+    report.inserted += len(batch)
+    return
+  except exc.DBAPIError:
+    db.session.rollback()
+
+  # the batch was rejected as a whole: insert row by row to find the culprits
+  for line_number, values in batch:
+    try:
+      db.session.execute(insert, values)
+      db.session.commit()
+      data_version.bump()
+      report.inserted += 1
+    except exc.DBAPIError as error:
+      db.session.rollback()
+      report.error(line_number, str(error.orig))
+
+'''
+import_questions(rows, batch_size)
+    inserts validated rows from ndjson_rows/csv_rows in batches
+    returns the ImportReport of the load
+'''
+def import_questions(rows, batch_size=IMPORT_BATCH_SIZE):
+  category_ids = {category_id for category_id, in db.session.query(Category.id)}
+  report = ImportReport()
+  batch = []
+
+  for line_number, row, error in rows:
+    if error is None:
+      values, error = validate_row(row, category_ids)
+    if error is not None:
+      report.error(line_number, error)
+      continue
+
+    batch.append((line_number, values))
+    if len(batch) >= batch_size:
+      insert_batch(batch, report)
+      batch = []
+
+  if batch:
+    insert_batch(batch, report)
+
+  # executemany bypasses the mapper events that feed the in-process
+  # duplicate index, so let it rebuild on its next lookup
+  if report.inserted:
+    ngram_duplicates.reset()
+
+  return report
+
+'''
+flask import-questions PATH
+    bulk loads questions from a .csv file or an NDJSON (.jsonl/.ndjson) file
+'''
+@click.command('import-questions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True,
+              help='Rows inserted and committed per batch.')
+@with_appcontext
+def import_questions_command(path, batch_size):
+  # read as bytes so a line that is not UTF-8 fails alone, not the import
+  with io.open(path, 'rb') as lines:
+    if os.path.splitext(path)[1].lower() == '.csv':
+      rows = csv_rows(lines)
+    else:
+      rows = ndjson_rows(lines)
+    report = import_questions(rows, batch_size)
+
+  click.echo('Inserted {} questions, {} rows failed.'.format(report.inserted, report.failed))
+  for error in report.errors:
+    click.echo('  line {line}: {error}'.format(**error))
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import threading
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Question, Category
+
+CATEGORY_CACHE_TTL = 300
+
+'''
+CategoryCache
+    keeps the formatted category list in process, so the endpoints that
+    send categories along with their payload do not query them every time
+    the list is dropped when a transaction that inserted, updated or
+    deleted a Category commits (not at flush, so a rollback keeps it and
+    a concurrent read cannot refill it from the old state), and is
+    reloaded at the latest ttl seconds after it was read, which bounds how
+    stale a worker can be after another worker changed the categories
+    etag identifies the cached list for If-None-Match requests
+'''
+class CategoryCache:
+  def __init__(self, ttl=CATEGORY_CACHE_TTL, clock=time.monotonic):
+    self.ttl = ttl
+    self.clock = clock
+    self.lock = threading.Lock()
+    self.expires_at = None
+    self.categories = None
+    self.etag = None
+
+  def load(self):
+    categories = [category.format() for category in Category.query.order_by(Category.id).all()]
+    body = json.dumps(categories, sort_keys=True).encode('utf-8')
+    self.categories = categories
+    self.etag = hashlib.sha1(body).hexdigest()
+    self.expires_at = self.clock() + self.ttl
+
+  def get(self):
+    with self.lock:
+      if self.categories is None or self.expires_at <= self.clock():
+        self.load()
+      return self.categories, self.etag
+
+  def formatted(self):
+    return self.get()[0]
+
+  def ids(self):
+    return [category['id'] for category in self.formatted()]
+
+  def invalidate(self, *args):
+    with self.lock:
+      self.categories = None
+      self.etag = None
+
+  def mark_changed(self, mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+      session.info['category_cache_stale'] = True
+
+  def after_commit(self, session):
+    if session.info.pop('category_cache_stale', False):
+      self.invalidate()
+
+  def after_rollback(self, session):
+    session.info.pop('category_cache_stale', None)
+
+
+category_cache = CategoryCache()
+event.listen(Category, 'after_insert', category_cache.mark_changed)
+event.listen(Category, 'after_update', category_cache.mark_changed)
+event.listen(Category, 'after_delete', category_cache.mark_changed)
+event.listen(Session, 'after_commit', category_cache.after_commit)
+event.listen(Session, 'after_rollback', category_cache.after_rollback)
+
+'''
+category_question_counts()
+    number of questions per category in one LEFT JOIN ... GROUP BY query,
+    categories without questions included with a count of 0
+'''
+def category_question_counts():
+  rows = db.session.query(Category.id, Category.type, func.count(Question.id)) \
+    .outerjoin(Question, Question.category == Category.id) \
+    .group_by(Category.id, Category.type) \
+    .order_by(Category.id) \
+    .all()
+
+  return [{
+    'id': category_id,
+    'type': category_type,
+    'total_questions': total_questions
+  } for category_id, category_type, total_questions in rows]
@@ -0,0 +1,227 @@
+import logging
+import re
+import threading
+
+from sqlalchemy import bindparam, event, func, literal_column, text
+
+from models import db, Question
+
+logger = logging.getLogger(__name__)
+
+# questions at least this similar (trigram Jaccard, 0..1) count as duplicates
+DUPLICATE_SIMILARITY = 0.8
+
+'''
+Duplicate question detectors
+    a new question is a duplicate when its normalized text (lower case,
+    punctuation and extra whitespace removed) equals that of an existing
+    question, or when the two are at least DUPLICATE_SIMILARITY alike by
+    trigram similarity
+
+        install(connection)   creates the indexes the detector needs
+        find(question_text)   returns the closest existing duplicate Question or None
+'''
+
+'''
+normalize_question(question_text)
+    lower-cases the text and collapses every run of non alphanumerics to one space
+'''
+def normalize_question(question_text):
+  return re.sub(r'[\W_]+', ' ', (question_text or '').lower()).strip()
+
+'''
+question_trigrams(question_text)
+    the set of word trigrams of the normalized text, padded the way pg_trgm
+    pads words so both detectors agree on what is similar
+'''
+def question_trigrams(question_text):
+  trigrams = set()
+  for word in normalize_question(question_text).split():
+    padded = '  ' + word + ' '
+    trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+  return trigrams
+
+def trigram_similarity(left, right):
+  if not left or not right:
+    return 0.0
+  return len(left & right) / len(left | right)
+
+
+'''
+PostgresDuplicates
+    exact matches: B-tree index on md5 of the normalized question, computed in SQL
+    near matches: pg_trgm GIN index on lower(question), searched with the % operator
+    the extension and both indexes come from migration 6a8d2f4c0e37; at
+    startup install() only checks for pg_trgm, without it only exact
+    matches are detected
+'''
+class PostgresDuplicates:
+  def __init__(self):
+    self.trigram = True
+
+  def install(self, connection):
+    self.trigram = connection.execute(text(
+      "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+    if not self.trigram:
+      logger.warning('pg_trgm unavailable, only exact duplicates are detected')
+
+  def normalized(self, value):
+    return func.md5(func.trim(func.regexp_replace(
+      func.lower(value),
+      literal_column("'[^[:alnum:]]+'"),
+      literal_column("' '"),
+      literal_column("'g'"))))
+
+  def find(self, question_text):
+    target = bindparam('question_text', question_text)
+    duplicate = Question.query \
+      .filter(self.normalized(Question.question) == self.normalized(target)) \
+      .first()
+    if duplicate is not None or not self.trigram:
+      return duplicate
+
+    # the pg_trgm % operator lets the GIN index prefilter candidates; as a
+    # text() clause SQLAlchemy escapes the % for the DBAPI's paramstyle
+    lowered = func.lower(Question.question)
+    similarity = func.similarity(lowered, func.lower(target))
+    return Question.query \
+      .filter(text('lower(questions.question) % lower(:question_text)')
+              .bindparams(question_text=question_text)) \
+      .filter(similarity >= DUPLICATE_SIMILARITY) \
+      .order_by(similarity.desc()) \
+      .first()
+
+
+'''
+NgramDuplicates
+    in-process fallback for databases without pg_trgm (SQLite test runs)
+    keeps a normalized text -> ids map and a trigram -> ids inverted index,
+    plus the normalized text and trigrams of each id so a write updates
+    both in time proportional to the question, not the bank
+    built from the questions table on first use and updated by mapper
+    events on Question inserts, updates and deletes
+    candidates are re-read from the database before being reported, so
+    ids left behind by rolled back writes are never returned
+'''
+class NgramDuplicates:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.built = False
+    self.exact = {}
+    self.normalized = {}
+    self.postings = {}
+    self.trigrams = {}
+
+  def install(self, connection):
+    # the index belongs to one database, start over when an app binds another
+    self.reset()
+
+  def add(self, question_id, question_text):
+    trigrams = question_trigrams(question_text)
+    normalized = normalize_question(question_text)
+    self.exact.setdefault(normalized, set()).add(question_id)
+    self.normalized[question_id] = normalized
+    self.trigrams[question_id] = trigrams
+    for trigram in trigrams:
+      self.postings.setdefault(trigram, set()).add(question_id)
+
+  def remove(self, question_id):
+    for trigram in self.trigrams.pop(question_id, ()):
+      self.postings[trigram].discard(question_id)
+    normalized = self.normalized.pop(question_id, None)
+    if normalized is not None:
+      ids = self.exact[normalized]
+      ids.discard(question_id)
+      if not ids:
+        del self.exact[normalized]
+
+  def build(self):
+    rows = db.session.query(Question.id, Question.question).all()
+    for question_id, question_text in rows:
+      self.add(question_id, question_text)
+    self.built = True
+
+  def reset(self):
+    with self.lock:
+      self.built = False
+      self.exact = {}
+      self.normalized = {}
+      self.postings = {}
+      self.trigrams = {}
+
+  def candidates(self, question_text):
+    with self.lock:
+      if not self.built:
+        self.build()
+
+      exact_ids = self.exact.get(normalize_question(question_text))
+      if exact_ids:
+        return sorted(exact_ids)
+
+      trigrams = question_trigrams(question_text)
+      shared = {}
+      for trigram in trigrams:
+        for question_id in self.postings.get(trigram, ()):
+          shared[question_id] = shared.get(question_id, 0) + 1
+
+      scored = []
+      for question_id, count in shared.items():
+        similarity = count / len(trigrams | self.trigrams[question_id])
+        if similarity >= DUPLICATE_SIMILARITY:
+          scored.append((similarity, question_id))
+      return [question_id for _, question_id in sorted(scored, reverse=True)]
+
+  def find(self, question_text):
+    normalized = normalize_question(question_text)
+    trigrams = question_trigrams(question_text)
+    for question_id in self.candidates(question_text):
+      question = Question.query.get(question_id)
+      if question is None:
+        continue
+      if normalize_question(question.question) == normalized or \
+          trigram_similarity(trigrams, question_trigrams(question.question)) >= DUPLICATE_SIMILARITY:
+        return question
+    return None
+
+  def on_write(self, mapper, connection, target):
+    with self.lock:
+      if self.built:
+        self.remove(target.id)
+        self.add(target.id, target.question)
+
+  def on_delete(self, mapper, connection, target):
+    with self.lock:
+      if self.built:
+        self.remove(target.id)
+
+
+ngram_duplicates = NgramDuplicates()
+event.listen(Question, 'after_insert', ngram_duplicates.on_write)
+event.listen(Question, 'after_update', ngram_duplicates.on_write)
+event.listen(Question, 'after_delete', ngram_duplicates.on_delete)
+
+detectors = {
+  'postgresql': PostgresDuplicates(),
+}
+
+'''
+duplicate_detector(bind)
+    returns the detector for the dialect of an engine or connection
+'''
+def duplicate_detector(bind):
+  return detectors.get(bind.dialect.name, ngram_duplicates)
+
+'''
+install_duplicate_detection(engine)
+    creates the duplicate detection indexes of the engine's dialect
+'''
+def install_duplicate_detection(engine):
+  with engine.begin() as connection:
+    duplicate_detector(connection).install(connection)
+
+'''
+find_duplicate_question(question_text)
+    returns an existing Question that duplicates question_text, or None
+'''
+def find_duplicate_question(question_text):
+  return duplicate_detector(db.session.get_bind()).find(question_text)
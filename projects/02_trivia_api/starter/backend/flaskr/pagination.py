@@ -0,0 +1,96 @@
+import base64
+import binascii
+
+from flask import abort
+from sqlalchemy import func
+
+from models import Question
+from .serialization import format_question_rows, question_rows
+
+MAX_CURSOR_LIMIT = 100
+
+'''
+count_questions(query)
+    returns the number of rows matched by a Question query
+    the count is issued as a bare SELECT count(id) so no rows are loaded
+'''
+def count_questions(query):
+  return query.with_entities(func.count(Question.id)).order_by(None).scalar()
+
+'''
+paginate_questions(request, query, per_page)
+    pushes the page window into the database with LIMIT/OFFSET
+    reads the 1-based page number from the ?page= query argument
+    returns a tuple of (formatted questions on the page, total matching questions)
+'''
+def paginate_questions(request, query, per_page):
+  page = request.args.get('page', 1, type=int)
+  if page < 1:
+    abort(400)
+
+  total = count_questions(query)
+  questions = question_rows(query).order_by(Question.id) \
+    .limit(per_page) \
+    .offset((page - 1) * per_page) \
+    .all()
+
+  return format_question_rows(questions), total
+
+'''
+encode_cursor(question_id) / decode_cursor(cursor)
+    convert the id of the last question on a page to and from
+    the opaque token handed to clients as next_cursor
+'''
+def encode_cursor(question_id):
+  return base64.urlsafe_b64encode(str(question_id).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+  try:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return int(base64.urlsafe_b64decode(padded.encode()).decode())
+  except (binascii.Error, UnicodeDecodeError, ValueError):
+    abort(400)
+
+'''
+cursor_paginate_questions(request, query, per_page)
+    keyset pagination on questions.id for ?after=<cursor>&limit=N requests
+    seeks past the cursor with WHERE id > :after instead of an OFFSET,
+    so every page costs the same however deep the client has scrolled
+    returns a tuple of (formatted questions on the page, next_cursor or None)
+'''
+def cursor_paginate_questions(request, query, per_page):
+  limit = request.args.get('limit', per_page, type=int)
+  if limit < 1 or limit > MAX_CURSOR_LIMIT:
+    abort(400)
+
+  after = request.args.get('after')
+  if after:
+    query = query.filter(Question.id > decode_cursor(after))
+
+  # fetch one extra row to find out whether another page exists
+  questions = question_rows(query).order_by(Question.id).limit(limit + 1).all()
+  next_cursor = None
+  if len(questions) > limit:
+    questions = questions[:limit]
+    next_cursor = encode_cursor(questions[-1].id)
+
+  return format_question_rows(questions), next_cursor
+
+'''
+questions_page(request, query, per_page)
+    picks cursor mode when the request carries ?after= or ?limit=,
+    page mode otherwise, and returns the pagination keys of the response
+'''
+def questions_page(request, query, per_page):
+  if 'after' in request.args or 'limit' in request.args:
+    f_questions, next_cursor = cursor_paginate_questions(request, query, per_page)
+    return {
+      'questions': f_questions,
+      'next_cursor': next_cursor
+    }
+
+  f_questions, total_questions = paginate_questions(request, query, per_page)
+  return {
+    'questions': f_questions,
+    'total_questions': total_questions
+  }
@@ -0,0 +1,125 @@
+import logging
+import re
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# a statement shape seen more often than this in one request is reported as N+1
+QUERY_REPEAT_THRESHOLD = 10
+SLOW_REQUEST_MS = 500
+# statement shapes listed in a slow request report
+SLOW_REPORT_STATEMENTS = 5
+
+'''
+statement_shape(statement)
+    the statement with literals, bound parameter markers and IN lists
+    collapsed, so the same query with other values has the same shape
+'''
+def statement_shape(statement):
+  shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+  shape = re.sub(r'%\(\w+\)s|%s|:\w+|\$\d+|\b\d+(?:\.\d+)?\b', '?', shape)
+  shape = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', shape)
+  return ' '.join(shape.split())
+
+'''
+RequestQueries
+    the statements one request ran: count and time per statement shape
+'''
+class RequestQueries:
+  def __init__(self, repeat_threshold=QUERY_REPEAT_THRESHOLD):
+    self.started = time.perf_counter()
+    self.repeat_threshold = repeat_threshold
+    self.count = 0
+    self.seconds = 0.0
+    self.shapes = {}
+    self.reported = set()
+    self.statement_started = None
+
+  def record(self, statement, seconds):
+    self.count += 1
+    self.seconds += seconds
+    shape = statement_shape(statement)
+    count, total = self.shapes.get(shape, (0, 0.0))
+    self.shapes[shape] = (count + 1, total + seconds)
+    return shape, count + 1
+
+  def top(self, limit):
+    return sorted(self.shapes.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+  queries = g.get('request_queries') if has_request_context() else None
+  if queries is not None:
+    queries.statement_started = time.perf_counter()
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+  queries = g.get('request_queries') if has_request_context() else None
+  if queries is None or queries.statement_started is None:
+    return
+  shape, count = queries.record(statement, time.perf_counter() - queries.statement_started)
+  queries.statement_started = None
+
+  if count > queries.repeat_threshold and shape not in queries.reported:
+    queries.reported.add(shape)
+    logger.warning('possible N+1: statement ran more than %d times in one request: %s',
+                   queries.repeat_threshold, shape)
+
+# listening on the Engine class covers every engine, replicas and engines
+# created after init_app included; requests that QueryStats does not track
+# have no g.request_queries and are skipped
+event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+'''
+QueryStats
+    Flask extension counting the SQL statements and database time of every
+    request. Responses get a Server-Timing header (db and app durations,
+    shown by browser dev tools), statement shapes repeating more than
+    QUERY_REPEAT_THRESHOLD times in one request are logged as possible N+1
+    queries, and requests slower than SLOW_REQUEST_MS log a report of their
+    most expensive statements
+
+        QueryStats(app)  or  query_stats = QueryStats(); query_stats.init_app(app)
+'''
+class QueryStats:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('QUERY_REPEAT_THRESHOLD', QUERY_REPEAT_THRESHOLD)
+    app.config.setdefault('SLOW_REQUEST_MS', SLOW_REQUEST_MS)
+    app.before_request(self.start)
+    app.after_request(self.add_server_timing)
+    app.teardown_request(self.finish)
+    app.extensions['query_stats'] = self
+
+  def start(self):
+    g.request_queries = RequestQueries(current_app.config['QUERY_REPEAT_THRESHOLD'])
+
+  def add_server_timing(self, response):
+    queries = g.get('request_queries')
+    if queries is not None:
+      elapsed = (time.perf_counter() - queries.started) * 1000
+      response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} queries"'.format(
+        queries.seconds * 1000, queries.count))
+      response.headers.add('Server-Timing', 'app;dur={:.2f}'.format(elapsed))
+    return response
+
+  def finish(self, error=None):
+    queries = g.pop('request_queries', None)
+    if queries is None:
+      return
+    elapsed = (time.perf_counter() - queries.started) * 1000
+    if elapsed < current_app.config['SLOW_REQUEST_MS']:
+      return
+
+    lines = ['slow request: {} {} took {:.1f} ms, {} queries in {:.1f} ms'.format(
+      request.method, request.full_path.rstrip('?'), elapsed, queries.count, queries.seconds * 1000)]
+    for shape, (count, seconds) in queries.top(SLOW_REPORT_STATEMENTS):
+      lines.append('  {:>5}x {:>9.1f} ms  {}'.format(count, seconds * 1000, shape))
+    logger.warning('\n'.join(lines))
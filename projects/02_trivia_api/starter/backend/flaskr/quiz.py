@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+
+from flask import abort
+from sqlalchemy import event
+
+from models import db, Question
+
+QUIZ_IDS_TTL = 300
+
+'''
+quiz_category_id(quiz_category)
+    maps the quiz_category sent by the frontend to a category id
+    the "ALL" button posts its click event, whose type is 'click'
+    returns None when questions from every category are allowed
+    aborts with 400 when quiz_category is not an object
+'''
+def quiz_category_id(quiz_category):
+  if not quiz_category:
+    return None
+  if not isinstance(quiz_category, dict):
+    abort(400)
+  if quiz_category.get('type') == 'click':
+    return None
+  try:
+    return int(quiz_category.get('type'))
+  except (TypeError, ValueError):
+    abort(400)
+
+'''
+previous_question_ids(previous_questions)
+    validates the previous_questions list of a quiz request
+    returns the ids as a set so duplicates never reach the NOT IN clause
+'''
+def previous_question_ids(previous_questions):
+  if not isinstance(previous_questions, list):
+    abort(400)
+  try:
+    return {int(question_id) for question_id in previous_questions}
+  except (TypeError, ValueError):
+    abort(400)
+
+'''
+IdArray
+    question ids in a list plus each id's position in it, so adding,
+    removing and drawing a random id are all O(1)
+'''
+class IdArray:
+  def __init__(self):
+    self.ids = []
+    self.positions = {}
+
+  def __len__(self):
+    return len(self.ids)
+
+  def __contains__(self, question_id):
+    return question_id in self.positions
+
+  def add(self, question_id):
+    if question_id not in self.positions:
+      self.positions[question_id] = len(self.ids)
+      self.ids.append(question_id)
+
+  def remove(self, question_id):
+    # the last id takes the place of the removed one
+    position = self.positions.pop(question_id, None)
+    if position is None:
+      return
+    last = self.ids.pop()
+    if last != question_id:
+      self.ids[position] = last
+      self.positions[last] = position
+
+  def choice(self, excluded):
+    # a uniformly drawn id not in excluded, None if there is none; while
+    # most ids are eligible it redraws on excluded ones (under two draws
+    # on average), otherwise the few eligible ids are listed
+    excluded_count = sum(1 for question_id in excluded if question_id in self.positions)
+    if excluded_count >= len(self.ids):
+      return None
+    if excluded_count * 2 < len(self.ids):
+      while True:
+        question_id = random.choice(self.ids)
+        if question_id not in excluded:
+          return question_id
+    return random.choice([question_id for question_id in self.ids if question_id not in excluded])
+
+
+'''
+QuizQuestionIds
+    in-process id arrays of every question and of each category's, so a
+    quiz turn draws an id without asking the database which questions are
+    eligible, and then loads that one question by primary key
+    built from the questions table on first use and kept current by
+    mapper events on Question inserts, updates and deletes; rebuilt at the
+    latest ttl seconds after it was built, which bounds how long another
+    worker's writes stay unseen. Drawn ids are read back from the database;
+    ids left behind by rolled back writes or another worker's deletes and
+    category changes are corrected and drawn again
+'''
+class QuizQuestionIds:
+  def __init__(self, ttl=QUIZ_IDS_TTL, clock=time.monotonic):
+    self.ttl = ttl
+    self.clock = clock
+    self.lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    self.expires_at = None
+    self.all = IdArray()
+    self.categories = {}
+    self.category_of = {}
+
+  def reset(self):
+    # the ids belong to one database, start over when an app binds another
+    with self.lock:
+      self.clear()
+
+  def add(self, question_id, category):
+    self.all.add(question_id)
+    self.categories.setdefault(category, IdArray()).add(question_id)
+    self.category_of[question_id] = category
+
+  def remove(self, question_id):
+    self.all.remove(question_id)
+    if question_id in self.category_of:
+      self.categories[self.category_of.pop(question_id)].remove(question_id)
+
+  def build(self):
+    self.clear()
+    for question_id, category in db.session.query(Question.id, Question.category):
+      self.add(question_id, category)
+    self.expires_at = self.clock() + self.ttl
+
+  def draw(self, category, previous):
+    with self.lock:
+      if self.expires_at is None or self.expires_at <= self.clock():
+        self.build()
+      ids = self.all if category is None else self.categories.get(category, IdArray())
+      return ids.choice(previous)
+
+  def on_write(self, mapper, connection, target):
+    with self.lock:
+      if self.expires_at is not None:
+        self.remove(target.id)
+        self.add(target.id, target.category)
+
+  def on_delete(self, mapper, connection, target):
+    with self.lock:
+      if self.expires_at is not None:
+        self.remove(target.id)
+
+  def correct(self, question_id, question):
+    # the database's view of a drawn id: gone, or in another category
+    with self.lock:
+      self.remove(question_id)
+      if question is not None:
+        self.add(question.id, question.category)
+
+
+quiz_question_ids = QuizQuestionIds()
+event.listen(Question, 'after_insert', quiz_question_ids.on_write)
+event.listen(Question, 'after_update', quiz_question_ids.on_write)
+event.listen(Question, 'after_delete', quiz_question_ids.on_delete)
+
+'''
+random_question(category, previous)
+    picks a random question that is not in previous, optionally within a category
+    every eligible question is equally likely; the id comes from
+    quiz_question_ids and only the drawn question is read, by primary key,
+    so a turn costs the same whatever the size of the bank
+    returns None when no eligible question is left
+'''
+def random_question(category=None, previous=()):
+  while True:
+    question_id = quiz_question_ids.draw(category, previous)
+    if question_id is None:
+      return None
+    question = Question.query.get(question_id)
+    if question is not None and (category is None or question.category == category):
+      return question
+    quiz_question_ids.correct(question_id, question)
@@ -0,0 +1,140 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from models import db, Question
+
+'''
+Quiz session stores
+    a quiz session holds the posted quiz_category and a shuffled deck of
+    question ids built once when the quiz starts; every turn pops one id,
+    so the client no longer resends previous_questions
+
+    both stores expose the same interface:
+        create(quiz_category, deck) -> session_id
+        pop(session_id) -> (quiz_category, question_id or None when the deck is empty)
+            raises KeyError for unknown or expired sessions
+'''
+
+'''
+MemoryQuizStore
+    in-process store, bounded to max_sessions with least recently used eviction
+    sessions expire ttl seconds after they were started
+'''
+class MemoryQuizStore:
+  def __init__(self, max_sessions=10000, ttl=3600, clock=time.monotonic):
+    self.max_sessions = max_sessions
+    self.ttl = ttl
+    self.clock = clock
+    self.sessions = OrderedDict()
+    self.lock = threading.Lock()
+
+  def create(self, quiz_category, deck):
+    session_id = uuid.uuid4().hex
+    with self.lock:
+      self.sessions[session_id] = (self.clock() + self.ttl, quiz_category, list(deck))
+      while len(self.sessions) > self.max_sessions:
+        self.sessions.popitem(last=False)
+    return session_id
+
+  def pop(self, session_id):
+    with self.lock:
+      session = self.sessions.get(session_id)
+      if session is None:
+        raise KeyError(session_id)
+
+      expires_at, quiz_category, deck = session
+      if expires_at <= self.clock():
+        del self.sessions[session_id]
+        raise KeyError(session_id)
+
+      self.sessions.move_to_end(session_id)
+      return quiz_category, deck.pop() if deck else None
+
+'''
+RedisQuizStore
+    keeps each deck in a Redis list so sessions are shared between workers
+    client is anything with the redis-py rpush/lpop/set/get/expire calls,
+    e.g. redis.Redis or a local fake in tests
+    the category is kept under its own key so an emptied deck can be told
+    apart from an expired session
+'''
+class RedisQuizStore:
+  def __init__(self, client, ttl=3600, prefix='quiz:'):
+    self.client = client
+    self.ttl = ttl
+    self.prefix = prefix
+
+  def create(self, quiz_category, deck):
+    session_id = uuid.uuid4().hex
+    deck_key, category_key = self.keys(session_id)
+
+    self.client.set(category_key, json.dumps(quiz_category))
+    self.client.expire(category_key, self.ttl)
+    if deck:
+      self.client.rpush(deck_key, *deck)
+      self.client.expire(deck_key, self.ttl)
+    return session_id
+
+  def pop(self, session_id):
+    deck_key, category_key = self.keys(session_id)
+
+    question_id = self.client.lpop(deck_key)
+    quiz_category = self.client.get(category_key)
+    if quiz_category is None:
+      raise KeyError(session_id)
+
+    if question_id is None:
+      return json.loads(quiz_category), None
+    return json.loads(quiz_category), int(question_id)
+
+  def keys(self, session_id):
+    return (self.prefix + session_id + ':deck',
+            self.prefix + session_id + ':category')
+
+'''
+quiz_store_from_env()
+    returns a RedisQuizStore when QUIZ_REDIS_URL is set, a MemoryQuizStore otherwise
+    redis is only imported when it is actually configured
+'''
+def quiz_store_from_env():
+  redis_url = os.environ.get('QUIZ_REDIS_URL')
+  if not redis_url:
+    return MemoryQuizStore()
+
+  import redis
+  return RedisQuizStore(redis.Redis.from_url(redis_url))
+
+'''
+shuffled_deck(category)
+    loads only the ids of the questions in a category (or all questions)
+    and returns them in random order
+'''
+def shuffled_deck(category=None):
+  query = db.session.query(Question.id)
+  if category is not None:
+    query = query.filter(Question.category == category)
+
+  deck = [question_id for question_id, in query.all()]
+  random.shuffle(deck)
+  return deck
+
+'''
+next_session_question(store, session_id)
+    pops ids off the session deck until one still names a question
+    (questions can be deleted while a quiz is running)
+    returns (quiz_category, Question or None once the deck is empty)
+'''
+def next_session_question(store, session_id):
+  while True:
+    quiz_category, question_id = store.pop(session_id)
+    if question_id is None:
+      return quiz_category, None
+
+    question = Question.query.get(question_id)
+    if question is not None:
+      return quiz_category, question
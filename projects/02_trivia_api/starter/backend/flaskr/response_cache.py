@@ -0,0 +1,103 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, request
+
+from models import data_version
+from .streaming import requested_stream_format
+
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 60
+
+'''
+ResponseCache
+    caches the encoded JSON body of successful GET responses, keyed by
+    path and query arguments, so a repeated request skips both the
+    database and the JSON encoding
+    an entry is only served while models.data_version still has the value
+    it was built under (every committed question or category write bumps
+    it) and for at most ttl seconds, which bounds staleness across workers
+    every cached response carries an ETag and Cache-Control, and requests
+    whose If-None-Match matches get a 304; the views negotiate a streamed
+    body on the Accept header, so responses carry Vary: Accept too
+'''
+class ResponseCache:
+  def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+               max_age=0, clock=time.monotonic):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.max_age = max_age
+    self.clock = clock
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key, version):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      if entry['version'] != version or entry['expires_at'] <= self.clock():
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      return entry
+
+  def put(self, key, version, response):
+    body = response.get_data()
+    etag = response.get_etag()[0] or hashlib.sha1(body).hexdigest()
+    entry = {
+      'version': version,
+      'expires_at': self.clock() + self.ttl,
+      'body': body,
+      'etag': etag,
+      'mimetype': response.mimetype
+    }
+    with self.lock:
+      self.entries[key] = entry
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+    return entry
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  '''
+  cached(view)
+      decorator for GET views returning JSON; only complete 200 responses
+      are stored, requests for a streamed format (requested_stream_format)
+      skip the cache both ways
+  '''
+  def cached(self, view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if requested_stream_format(request):
+        response = current_app.make_response(view(*args, **kwargs))
+        response.vary.add('Accept')
+        return response
+
+      key = (request.path, tuple(sorted(request.args.items(multi=True))))
+      # read the version before the view runs, so a write that lands while
+      # the body is built leaves the entry already outdated
+      version = data_version.value
+
+      entry = self.get(key, version)
+      if entry is None:
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+          response.vary.add('Accept')
+          return response
+        entry = self.put(key, version, response)
+
+      response = Response(entry['body'], mimetype=entry['mimetype'])
+      response.set_etag(entry['etag'])
+      response.cache_control.public = True
+      response.cache_control.max_age = self.max_age
+      response.vary.add('Accept')
+      return response.make_conditional(request)
+
+    return wrapper
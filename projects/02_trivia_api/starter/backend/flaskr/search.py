@@ -0,0 +1,157 @@
+import re
+
+from sqlalchemy import Float, Integer, func, literal_column, or_, text
+
+from models import Question
+
+'''
+Question search backends
+    each backend knows how to build and maintain a full-text index for the
+    questions table of one database dialect, and how to turn a search term
+    into a ranked Question query that matches on both question and answer
+
+        install(connection)   sets up what the index needs at app startup
+        search(query, term)   filters and orders a Question query by relevance
+
+    the index is maintained by the database itself (an expression index on
+    PostgreSQL, triggers on SQLite), so Question.insert/update/delete and
+    any bulk writes keep it current without extra calls
+'''
+
+'''
+search_tokens(term)
+    splits a search term into word tokens, dropping any query syntax
+'''
+def search_tokens(term):
+  return re.findall(r'\w+', term or '')
+
+
+'''
+PostgresSearch
+    GIN index over a weighted tsvector of the question (A) and answer (B)
+    every token is matched as a prefix so results update while typing
+    the index is built by migration 6a8d2f4c0e37, not at startup, where
+    every worker would race to build it and block writes while it does
+'''
+class PostgresSearch:
+  config = 'english'
+
+  def install(self, connection):
+    pass
+
+  def vector(self):
+    config = literal_column("'{}'".format(self.config))
+    question = func.setweight(
+      func.to_tsvector(config, func.coalesce(Question.question, '')), literal_column("'A'"))
+    answer = func.setweight(
+      func.to_tsvector(config, func.coalesce(Question.answer, '')), literal_column("'B'"))
+    return question.op('||')(answer)
+
+  def search(self, query, term):
+    tokens = search_tokens(term)
+    if not tokens:
+      return query
+
+    ts_query = func.to_tsquery(
+      literal_column("'{}'".format(self.config)),
+      ' & '.join(token + ':*' for token in tokens))
+    vector = self.vector()
+    return query.filter(vector.op('@@')(ts_query)) \
+      .order_by(func.ts_rank(vector, ts_query).desc())
+
+
+'''
+SqliteSearch
+    FTS5 table questions_fts keyed by the question id, kept in sync with
+    questions by insert/update/delete triggers; used for local test runs
+    ranks with bm25, weighting question matches above answer matches
+'''
+class SqliteSearch:
+  triggers = {'questions_fts_insert', 'questions_fts_update', 'questions_fts_delete'}
+
+  install_ddl = [
+    "DROP TABLE IF EXISTS questions_fts",
+    "DROP TRIGGER IF EXISTS questions_fts_insert",
+    "DROP TRIGGER IF EXISTS questions_fts_update",
+    "DROP TRIGGER IF EXISTS questions_fts_delete",
+    "CREATE VIRTUAL TABLE questions_fts USING fts5(question, answer)",
+    "CREATE TRIGGER questions_fts_insert AFTER INSERT ON questions BEGIN "
+    "INSERT INTO questions_fts(rowid, question, answer) "
+    "VALUES (new.id, new.question, new.answer); END",
+    "CREATE TRIGGER questions_fts_update AFTER UPDATE ON questions BEGIN "
+    "DELETE FROM questions_fts WHERE rowid = old.id; "
+    "INSERT INTO questions_fts(rowid, question, answer) "
+    "VALUES (new.id, new.question, new.answer); END",
+    "CREATE TRIGGER questions_fts_delete AFTER DELETE ON questions BEGIN "
+    "DELETE FROM questions_fts WHERE rowid = old.id; END",
+    "INSERT INTO questions_fts(rowid, question, answer) "
+    "SELECT id, question, answer FROM questions",
+  ]
+
+  # table rebuilds (e.g. batch migrations) drop the triggers with the old
+  # table, so the index is rebuilt whenever one of them is missing
+  def install(self, connection):
+    installed = {name for name, in connection.execute(text(
+      "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'questions'"))}
+    if self.triggers <= installed:
+      return
+    for statement in self.install_ddl:
+      connection.execute(text(statement))
+
+  def search(self, query, term):
+    tokens = search_tokens(term)
+    if not tokens:
+      return query
+
+    match = ' '.join('"{}"*'.format(token) for token in tokens)
+    hits = text(
+      "SELECT rowid AS id, bm25(questions_fts, 2.0, 1.0) AS rank "
+      "FROM questions_fts WHERE questions_fts MATCH :match") \
+      .bindparams(match=match) \
+      .columns(id=Integer, rank=Float) \
+      .alias('hits')
+    return query.join(hits, hits.c.id == Question.id).order_by(hits.c.rank)
+
+
+'''
+LikeSearch
+    fallback for other databases: unindexed case-insensitive substring match
+'''
+class LikeSearch:
+  def install(self, connection):
+    pass
+
+  def search(self, query, term):
+    pattern = '%{}%'.format(term or '')
+    return query.filter(or_(
+      Question.question.ilike(pattern),
+      Question.answer.ilike(pattern)))
+
+
+backends = {
+  'postgresql': PostgresSearch(),
+  'sqlite': SqliteSearch(),
+}
+
+'''
+search_backend(bind)
+    returns the backend for the dialect of an engine or connection
+'''
+def search_backend(bind):
+  return backends.get(bind.dialect.name, LikeSearch())
+
+'''
+install_search(engine)
+    creates the search index of the engine's dialect inside one transaction
+'''
+def install_search(engine):
+  with engine.begin() as connection:
+    search_backend(connection).install(connection)
+
+'''
+search_questions_query(query, term)
+    ranked full-text search over a Question query, using the backend of
+    the database the query's session is bound to
+'''
+def search_questions_query(query, term):
+  return search_backend(query.session.get_bind()).search(query, term)
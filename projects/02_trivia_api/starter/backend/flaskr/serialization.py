@@ -0,0 +1,37 @@
+import json
+
+from models import Question
+
+try:
+  import orjson
+except ImportError:  # optional, the standard library encoder is used without it
+  orjson = None
+
+'''
+Question serialization without ORM objects
+    question_rows(query) narrows a Question query to the five columns that
+    Question.format() reports, so rows come back as plain tuples with no
+    identity map or attribute instrumentation; format_question_rows turns
+    them into the same dicts as Question.format()
+'''
+QUESTION_KEYS = ('id', 'question', 'answer', 'category', 'difficulty')
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+
+def question_rows(query):
+  return query.with_entities(*QUESTION_COLUMNS)
+
+def format_question_row(row):
+  return dict(zip(QUESTION_KEYS, row))
+
+def format_question_rows(rows):
+  return [dict(zip(QUESTION_KEYS, row)) for row in rows]
+
+'''
+dumps(value)
+    encodes value to JSON bytes, with orjson when it is installed
+'''
+def dumps(value):
+  if orjson is not None:
+    return orjson.dumps(value)
+  return json.dumps(value, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,51 @@
+from flask import Response, stream_with_context
+
+from models import Question
+from .serialization import dumps, format_question_row, question_rows
+
+STREAM_BATCH_SIZE = 1000
+
+'''
+requested_stream_format(request, default)
+    'ndjson' for ?format=ndjson or an Accept header preferring application/x-ndjson,
+    'json' for ?format=json-stream, default otherwise (None means a normal page)
+'''
+def requested_stream_format(request, default=None):
+  requested = request.args.get('format')
+  if requested == 'ndjson':
+    return 'ndjson'
+  if requested == 'json-stream':
+    return 'json'
+  # ties (e.g. */*) go to application/json, the first offer
+  best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+  if best == 'application/x-ndjson':
+    return 'ndjson'
+  return default
+
+'''
+stream_questions(query, stream_format, batch_size)
+    streams every question matched by query instead of building the body in memory
+    rows are fetched batch_size at a time (yield_per, a server-side cursor on
+    PostgreSQL) and written out as they arrive, so memory stays flat and the
+    first bytes leave before the query is exhausted
+        'json'    {"success": true, "questions": [...], "total_questions": n}
+        'ndjson'  one question object per line
+'''
+def stream_questions(query, stream_format, batch_size=STREAM_BATCH_SIZE):
+  rows = question_rows(query).order_by(Question.id).yield_per(batch_size)
+
+  def generate_ndjson():
+    for row in rows:
+      yield dumps(format_question_row(row)) + b'\n'
+
+  def generate_json():
+    yield b'{"success": true, "questions": ['
+    total = 0
+    for row in rows:
+      yield (b',' if total else b'') + dumps(format_question_row(row))
+      total += 1
+    yield b'], "total_questions": %d}' % total
+
+  if stream_format == 'ndjson':
+    return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+  return Response(stream_with_context(generate_json()), mimetype='application/json')
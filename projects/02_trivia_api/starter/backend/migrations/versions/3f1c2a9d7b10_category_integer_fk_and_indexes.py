@@ -0,0 +1,67 @@
+"""questions.category as an integer foreign key, with category and difficulty indexes
+
+Revision ID: 3f1c2a9d7b10
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# databases restored from trivia.psql already have an integer category
+# column and a foreign key, databases created by the old models have a
+# varchar column and neither; every step checks what is already there
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name']: column for column in inspector.get_columns('questions')}
+    foreign_keys = [fk for fk in inspector.get_foreign_keys('questions')
+                    if fk['constrained_columns'] == ['category']]
+    indexes = {index['name'] for index in inspector.get_indexes('questions')}
+
+    if not isinstance(columns['category']['type'], sa.Integer):
+        if op.get_bind().dialect.name == 'postgresql':
+            op.execute("UPDATE questions SET category = NULL WHERE category !~ '^[0-9]+$'")
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.alter_column('category',
+                                  existing_type=sa.String(),
+                                  type_=sa.Integer(),
+                                  postgresql_using='category::integer')
+
+    if not foreign_keys:
+        op.execute("UPDATE questions SET category = NULL "
+                   "WHERE category NOT IN (SELECT id FROM categories)")
+
+    with op.batch_alter_table('questions') as batch_op:
+        if not foreign_keys:
+            batch_op.create_foreign_key('fk_questions_category', 'categories',
+                                        ['category'], ['id'],
+                                        onupdate='CASCADE', ondelete='SET NULL')
+        if 'ix_questions_category_id' not in indexes:
+            batch_op.create_index('ix_questions_category_id', ['category', 'id'])
+        if 'ix_questions_difficulty' not in indexes:
+            batch_op.create_index('ix_questions_difficulty', ['difficulty'])
+
+
+# the foreign key on category is dropped whatever its name: upgrade names
+# the one it creates fk_questions_category, trivia.psql's is "category";
+# SQLite reports no name, and does not mind a text column referencing an integer id
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    foreign_keys = [fk['name'] for fk in inspector.get_foreign_keys('questions')
+                    if fk['constrained_columns'] == ['category'] and fk['name']]
+
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_index('ix_questions_difficulty')
+        batch_op.drop_index('ix_questions_category_id')
+        for name in foreign_keys:
+            batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.alter_column('category',
+                              existing_type=sa.Integer(),
+                              type_=sa.String())
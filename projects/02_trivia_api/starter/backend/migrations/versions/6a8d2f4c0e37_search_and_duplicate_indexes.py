@@ -0,0 +1,63 @@
+"""Full-text search and duplicate detection indexes on questions (PostgreSQL)
+
+Revision ID: 6a8d2f4c0e37
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a8d2f4c0e37'
+down_revision = '3f1c2a9d7b10'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+# the expressions must stay those flaskr.search.PostgresSearch and
+# flaskr.duplicates.PostgresDuplicates query with, or the planner skips the indexes
+SEARCH_INDEX = (
+    "ix_questions_search ON questions USING gin ("
+    "setweight(to_tsvector('english', coalesce(question, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(answer, '')), 'B'))"
+)
+NORMALIZED_INDEX = (
+    "ix_questions_normalized ON questions "
+    "(md5(trim(regexp_replace(lower(question), '[^[:alnum:]]+', ' ', 'g'))))"
+)
+TRIGRAM_INDEX = "ix_questions_question_trgm ON questions USING gin (lower(question) gin_trgm_ops)"
+
+
+# built CONCURRENTLY, so a large questions table keeps taking writes while
+# they build; that cannot run inside a transaction, hence the autocommit
+# block. A concurrent build that fails leaves an invalid index behind:
+# drop it and upgrade again. SQLite's FTS5 table and triggers are set up by
+# the app at startup instead (flaskr.search.SqliteSearch)
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ' + SEARCH_INDEX)
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ' + NORMALIZED_INDEX)
+        try:
+            op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except sa.exc.DBAPIError as error:
+            logger.warning('pg_trgm unavailable, only exact duplicates are detected: %s', error)
+            return
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ' + TRIGRAM_INDEX)
+
+
+# pg_trgm is left installed, other database objects may use it
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        for name in ['ix_questions_question_trgm', 'ix_questions_normalized', 'ix_questions_search']:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
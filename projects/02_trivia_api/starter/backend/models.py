@@ -1,36 +1,360 @@
+import functools
+import logging
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import threading
+import time
+from flask import has_request_context, request
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine, event, exc, orm, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
 
+logger = logging.getLogger(__name__)
+
 database_name = "trivia"
 # database_path = "postgresql://postgres@{}/{}".format('localhost:5432', database_name)
 database_path = f"postgres:///{database_name}"
 
-db = SQLAlchemy()
+'''
+RoutingSession
+    session that runs the queries of read-only views (see replica_reads) on
+    a read replica picked by the ReplicaRouter, and everything else,
+    flushes included, on the primary
+'''
+class RoutingSession(SignallingSession):
+  def get_bind(self, mapper=None, clause=None):
+    if has_request_context() and getattr(request, 'replica_reads', False) and not self._flushing:
+      engine = replicas.engine()
+      if engine is not None:
+        return engine
+    return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+db = RoutingSQLAlchemy()
+
+'''
+Connection pool profiles
+    engine pool settings per deployment shape, chosen with the
+    DATABASE_POOL_PROFILE config key or environment variable; sizes are per
+    process, so N gunicorn workers hold at most N * (pool_size + max_overflow)
+    connections. DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT
+    and DATABASE_POOL_RECYCLE override single settings of the profile
+
+        default    single process development server
+        web        many single threaded gunicorn workers
+        threaded   gthread / gevent workers serving requests concurrently
+        batch      CLI commands and scripts
+'''
+POOL_PROFILES = {
+  'default': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': 1800},
+  'web': {'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 10, 'pool_recycle': 1800},
+  'threaded': {'pool_size': 10, 'max_overflow': 10, 'pool_timeout': 10, 'pool_recycle': 1800},
+  'batch': {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 60, 'pool_recycle': 3600},
+}
+POOL_ENVIRONMENT = {
+  'pool_size': 'DATABASE_POOL_SIZE',
+  'max_overflow': 'DATABASE_MAX_OVERFLOW',
+  'pool_timeout': 'DATABASE_POOL_TIMEOUT',
+  'pool_recycle': 'DATABASE_POOL_RECYCLE',
+}
 
 '''
-setup_db(app)
+pool_options(database_path, profile)
+    SQLAlchemy engine options for a pool profile; connections are pinged
+    before use and recycled. Sizes do not apply to SQLite, which
+    Flask-SQLAlchemy serves from a NullPool (one connection per checkout)
+'''
+def pool_options(database_path, profile='default'):
+  if profile not in POOL_PROFILES:
+    raise ValueError('unknown pool profile {!r}, expected one of {}'.format(
+      profile, ', '.join(sorted(POOL_PROFILES))))
+
+  settings = dict(POOL_PROFILES[profile])
+  for option, variable in POOL_ENVIRONMENT.items():
+    if os.environ.get(variable):
+      settings[option] = int(os.environ[variable])
+
+  options = {'pool_pre_ping': True, 'pool_recycle': settings['pool_recycle']}
+  if make_url(database_path).get_backend_name() != 'sqlite':
+    options.update(settings, poolclass=MeteredQueuePool)
+  return options
+
+'''
+setup_db(app, database_path, pool_profile, replica_paths)
     binds a flask application and a SQLAlchemy service
+    pool_profile defaults to DATABASE_POOL_PROFILE from the app config or the
+    environment; SQLALCHEMY_ENGINE_OPTIONS in the app config override it
+    replica_paths defaults to the DATABASE_REPLICAS list from the app config
+    or the comma separated DATABASE_REPLICAS environment variable; replicas
+    are expected to carry the primary's schema already
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, pool_profile=None, replica_paths=None):
+    pool_profile = pool_profile or app.config.get('DATABASE_POOL_PROFILE') or \
+        os.environ.get('DATABASE_POOL_PROFILE', 'default')
+    options = pool_options(database_path, pool_profile)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+
+    if replica_paths is None:
+        replica_paths = app.config.get('DATABASE_REPLICAS') or \
+            [path for path in os.environ.get('DATABASE_REPLICAS', '').split(',') if path.strip()]
+    replicas.configure(
+        [create_engine(path.strip(), **pool_options(path.strip(), pool_profile)) for path in replica_paths],
+        max_lag=app.config.get('REPLICA_MAX_LAG', REPLICA_MAX_LAG),
+        check_interval=app.config.get('REPLICA_CHECK_INTERVAL', REPLICA_CHECK_INTERVAL))
+
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
     db.app = app
     db.init_app(app)
     db.create_all()
 
+'''
+PoolStats
+    counters of a MeteredQueuePool: checkouts, new connections, connections
+    invalidated (stale ones caught by pre-ping among them), and how long
+    checkouts waited for a free connection or gave up after pool_timeout
+'''
+class PoolStats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.checkouts = 0
+    self.connects = 0
+    self.invalidations = 0
+    self.timeouts = 0
+    self.wait_total = 0.0
+    self.wait_longest = 0.0
+
+  def checkout(self, seconds, timed_out=False):
+    with self.lock:
+      self.wait_total += seconds
+      self.wait_longest = max(self.wait_longest, seconds)
+      if timed_out:
+        self.timeouts += 1
+      else:
+        self.checkouts += 1
+
+  def connect(self):
+    with self.lock:
+      self.connects += 1
+
+  def invalidate(self, dbapi_connection, connection_record, exception):
+    with self.lock:
+      self.invalidations += 1
+
+  def format(self):
+    with self.lock:
+      waits = self.checkouts + self.timeouts
+      return {
+        'checkouts': self.checkouts,
+        'connects': self.connects,
+        'invalidations': self.invalidations,
+        'timeouts': self.timeouts,
+        'wait_total_ms': round(self.wait_total * 1000, 3),
+        'wait_mean_ms': round(self.wait_total * 1000 / waits, 3) if waits else 0.0,
+        'wait_max_ms': round(self.wait_longest * 1000, 3)
+      }
+
+'''
+MeteredQueuePool
+    QueuePool that keeps PoolStats; the stats carry over to the pool that
+    replaces it on engine.dispose()
+'''
+class MeteredQueuePool(QueuePool):
+  def __init__(self, *args, **kwargs):
+    recreated = '_dispatch' in kwargs
+    super().__init__(*args, **kwargs)
+    self.stats = PoolStats()
+    if not recreated:
+      event.listen(self, 'invalidate', self.stats.invalidate)
+
+  def _do_get(self):
+    started = time.perf_counter()
+    try:
+      connection = super()._do_get()
+    except exc.TimeoutError:
+      self.stats.checkout(time.perf_counter() - started, timed_out=True)
+      raise
+    self.stats.checkout(time.perf_counter() - started)
+    return connection
+
+  def _create_connection(self):
+    self.stats.connect()
+    return super()._create_connection()
+
+  def recreate(self):
+    pool = super().recreate()
+    pool.stats = self.stats
+    return pool
+
+'''
+pool_metrics(engine)
+    live pool utilization of an engine: size, checked out and overflow
+    connections of a queue pool, plus the PoolStats of a MeteredQueuePool
+'''
+def pool_metrics(engine):
+  pool = engine.pool
+  metrics = {'pool': type(pool).__name__}
+  if isinstance(pool, QueuePool):
+    metrics.update({
+      'size': pool.size(),
+      'checked_in': pool.checkedin(),
+      'checked_out': pool.checkedout(),
+      'overflow': max(pool.overflow(), 0),
+      'timeout': pool.timeout()
+    })
+  if isinstance(pool, MeteredQueuePool):
+    metrics.update(pool.stats.format())
+  return metrics
+
+# replicas further behind the primary than this many seconds serve no reads
+REPLICA_MAX_LAG = 10
+REPLICA_CHECK_INTERVAL = 5
+
+# seconds a replica's last replayed transaction trails its primary; 0 when
+# it is caught up or is not a replica. Other dialects have no replication
+# to measure, so they are only checked for being reachable
+REPLICATION_LAG_SQL = {
+  'postgresql': (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+  ),
+}
+
+'''
+replication_lag(engine)
+    the replication lag of a replica in seconds, or None if it cannot be reached
+'''
+def replication_lag(engine):
+  try:
+    with engine.connect() as connection:
+      lag = connection.execute(text(REPLICATION_LAG_SQL.get(engine.dialect.name, 'SELECT 0'))).scalar()
+  except exc.DBAPIError as error:
+    logger.warning('replica %s unreachable: %s', engine.url, error)
+    return None
+  return float(lag or 0)
+
+class Replica:
+  def __init__(self, engine):
+    self.engine = engine
+    self.lag = None
+    self.checked_at = None
+
+'''
+ReplicaRouter
+    hands out read replica engines in round-robin order, skipping replicas
+    that are unreachable or lag more than max_lag seconds; each replica's
+    lag is re-checked at most every check_interval seconds. engine()
+    returns None when no replica is fit, and reads fall back to the primary;
+    after wrote() (called on every data_version bump) reads stay on the
+    primary for max_lag seconds: a replica within the lag limit may not
+    have the write yet, and what it returned would fill the response and
+    category caches under the new data version
+'''
+class ReplicaRouter:
+  def __init__(self, clock=time.monotonic):
+    self.lock = threading.Lock()
+    self.clock = clock
+    self.replicas = []
+    self.turn = 0
+    self.max_lag = REPLICA_MAX_LAG
+    self.check_interval = REPLICA_CHECK_INTERVAL
+    self.primary_until = None
+
+  def configure(self, engines, max_lag=REPLICA_MAX_LAG, check_interval=REPLICA_CHECK_INTERVAL):
+    with self.lock:
+      for replica in self.replicas:
+        replica.engine.dispose()
+      self.replicas = [Replica(engine) for engine in engines]
+      self.turn = 0
+      self.max_lag = max_lag
+      self.check_interval = check_interval
+      self.primary_until = None
+
+  def fit(self, replica):
+    now = self.clock()
+    if replica.checked_at is None or now - replica.checked_at >= self.check_interval:
+      # claim the check first so concurrent readers do not all run it
+      replica.checked_at = now
+      replica.lag = replication_lag(replica.engine)
+    return replica.lag is not None and replica.lag <= self.max_lag
+
+  def wrote(self):
+    with self.lock:
+      self.primary_until = self.clock() + self.max_lag
+
+  def engine(self):
+    with self.lock:
+      if not self.replicas:
+        return None
+      if self.primary_until is not None and self.clock() < self.primary_until:
+        return None
+      order = self.replicas[self.turn:] + self.replicas[:self.turn]
+      self.turn = (self.turn + 1) % len(self.replicas)
+
+    for replica in order:
+      if self.fit(replica):
+        return replica.engine
+    return None
+
+  def engines(self):
+    return [replica.engine for replica in self.replicas]
+
+replicas = ReplicaRouter()
+
+'''
+@replica_reads
+    marks a view as read-only: its queries, including those of a streamed
+    response body, go to a read replica when one is fit; the view must not
+    write
+'''
+def replica_reads(view):
+  @functools.wraps(view)
+  def wrapper(*args, **kwargs):
+    request.replica_reads = True
+    return view(*args, **kwargs)
+  return wrapper
+
+'''
+DataVersion
+    counter bumped after every committed write to questions or categories
+    read-side caches remember the value they were built under and treat
+    anything built under an older value as stale; a bump also keeps reads
+    off the replicas until they can have caught up (ReplicaRouter.wrote)
+'''
+class DataVersion:
+  def __init__(self):
+    self.value = 0
+    self.lock = threading.Lock()
+
+  def bump(self):
+    with self.lock:
+      self.value += 1
+    replicas.wrote()
+
+data_version = DataVersion()
+
 '''
 Question
 
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (
+    # category listings and quiz draws filter on category and walk or seek on id
+    Index('ix_questions_category_id', 'category', 'id'),
+    Index('ix_questions_difficulty', 'difficulty'),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -42,13 +366,16 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    data_version.bump()
   
   def update(self):
     db.session.commit()
+    data_version.bump()
 
   def delete(self):
     db.session.delete(self)
     db.session.commit()
+    data_version.bump()
 
   def format(self):
     return {
@@ -72,6 +399,20 @@ class Category(db.Model):
   def __init__(self, type):
     self.type = type
 
+  def insert(self):
+    db.session.add(self)
+    db.session.commit()
+    data_version.bump()
+  
+  def update(self):
+    db.session.commit()
+    data_version.bump()
+
+  def delete(self):
+    db.session.delete(self)
+    db.session.commit()
+    data_version.bump()
+
   def format(self):
     return {
       'id': self.id,
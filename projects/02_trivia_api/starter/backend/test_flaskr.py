@@ -1,10 +1,45 @@
+import io
 import os
+import shutil
+import tempfile
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.bulk_import import csv_rows
+from flaskr.categories import category_cache
+from flaskr.query_stats import statement_shape
+from flaskr.quiz_sessions import MemoryQuizStore, RedisQuizStore
+from models import setup_db, db, pool_options, replicas, Question, Category
+
+
+class FakeRedis:
+    """In-memory stand-in for the few redis-py calls RedisQuizStore makes"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value):
+        self.data[key] = value.encode()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(str(v).encode() for v in values)
+
+    def lpop(self, key):
+        values = self.data.get(key)
+        if not values:
+            return None
+        value = values.pop(0)
+        if not values:
+            del self.data[key]
+        return value
+
+    def expire(self, key, seconds):
+        pass
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -33,7 +68,525 @@ class TriviaTestCase(unittest.TestCase):
     TODO
     Write at least one test for each test for successful operation and for expected errors.
     """
+    def test_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+    def test_category_writes_invalidate_cache(self):
+        etag = self.client().get('/categories').headers['ETag']
+
+        with self.app.app_context():
+            category = Category(type='Music')
+            category.insert()
+            category_id = category.id
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            Category.query.get(category_id).delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(category_id, data['categories'])
+
+    def test_rolled_back_category_write_keeps_cache(self):
+        self.client().get('/categories')
+
+        with self.app.app_context():
+            db.session.add(Category(type='Rolled back'))
+            db.session.flush()
+            # flushed but not committed: other requests still see the old list
+            self.assertIsNotNone(category_cache.categories)
+            db.session.rollback()
+
+        self.assertIsNotNone(category_cache.categories)
+        data = json.loads(self.client().get('/categories').data)
+        with self.app.app_context():
+            self.assertIsNone(Category.query.filter(Category.type == 'Rolled back').first())
+        self.assertEqual(len(data['categories']), len(category_cache.categories))
+
+    def test_category_stats(self):
+        res = self.client().get('/categories/stats')
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            total = Question.query.count()
+            science = Question.query.filter(Question.category == 1).count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], total)
+        self.assertEqual(data['categories'][0]['id'], 1)
+        self.assertEqual(data['categories'][0]['total_questions'], science)
+
+    def test_get_paginated_questions(self):
+        res = self.client().get('/questions?page=1')
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            total = Question.query.count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['questions']) <= 20)
+        self.assertEqual(data['total_questions'], total)
+
+    def test_questions_not_modified(self):
+        res = self.client().get('/questions?page=1')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/questions?page=1', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertIn('max-age', res.headers['Cache-Control'])
+
+    def test_question_writes_invalidate_cached_responses(self):
+        res = self.client().get('/questions?page=1')
+        etag = res.headers['ETag']
+        total = json.loads(res.data)['total_questions']
+
+        with self.app.app_context():
+            question = Question('Cache test question?', 'Yes', 1, 1)
+            question.insert()
+            question_id = question.id
+
+        res = self.client().get('/questions?page=1', headers={'If-None-Match': etag})
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            Question.query.get(question_id).delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], total + 1)
+
+    def test_stream_questions_as_json(self):
+        res = self.client().get('/questions?format=json-stream')
+        streamed = res.is_streamed
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            total = Question.query.count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(streamed)
+        self.assertEqual(len(data['questions']), total)
+        self.assertEqual(data['total_questions'], total)
+
+    def test_ndjson_request_skips_cached_json(self):
+        res = self.client().get('/questions')
+        self.assertIn('Accept', res.headers['Vary'])
+
+        res = self.client().get('/questions', headers={'Accept': 'application/x-ndjson'})
+        lines = res.data.decode('utf-8').splitlines()
+
+        with self.app.app_context():
+            total = Question.query.count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertIn('Accept', res.headers['Vary'])
+        self.assertEqual(len(lines), total)
+        self.assertIn('question', json.loads(lines[0]))
+
+    def test_export_questions_as_ndjson(self):
+        res = self.client().get('/questions/export?category=1')
+        lines = res.data.decode('utf-8').splitlines()
+
+        with self.app.app_context():
+            total = Question.query.filter(Question.category == 1).count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), total)
+        self.assertEqual(json.loads(lines[0])['category'], 1)
+
+    def test_400_for_invalid_page(self):
+        res = self.client().get('/questions?page=0')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_cursor_pagination_walks_all_questions(self):
+        seen = []
+        url = '/questions?limit=5'
+        while url:
+            res = self.client().get(url)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('total_questions', data)
+            seen.extend(question['id'] for question in data['questions'])
+            cursor = data['next_cursor']
+            url = '/questions?limit=5&after={}'.format(cursor) if cursor else None
+
+        with self.app.app_context():
+            ids = [question.id for question in Question.query.order_by(Question.id).all()]
+
+        self.assertEqual(seen, ids)
+
+    def test_400_for_invalid_cursor(self):
+        res = self.client().get('/questions?after=not-a-cursor!')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_get_category_questions_total(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            total = Question.query.filter(Question.category == 1).count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], total)
+
+    def test_search_questions(self):
+        res = self.client().post('/questions', json={'searchTerm': 'title'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['total_questions'] > 0)
+        for question in data['questions']:
+            text = (question['question'] + ' ' + question['answer']).lower()
+            self.assertIn('title', text)
+
+    def test_400_for_invalid_search_request(self):
+        res = self.client().post('/questions?page=0', json={'searchTerm': 'title'})
+        self.assertEqual(res.status_code, 400)
+
+        res = self.client().post('/questions', data='searchTerm=title',
+                                 content_type='application/x-www-form-urlencoded')
+        self.assertEqual(res.status_code, 400)
+
+    def test_search_matches_answers(self):
+        with self.app.app_context():
+            question = Question.query.order_by(Question.id).first()
+            answer = question.answer
+
+        res = self.client().post('/questions', json={'searchTerm': answer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['total_questions'] > 0)
+
+    def test_create_question(self):
+        res = self.client().post('/questions/create', json={
+            'question': 'Which planet has the largest number of known moons?',
+            'answer': 'Saturn',
+            'difficulty': 3,
+            'category': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['success'], True)
+
+        with self.app.app_context():
+            Question.query.get(data['created']).delete()
+
+    def test_422_for_near_duplicate_question(self):
+        with self.app.app_context():
+            question = Question.query.order_by(Question.id).first()
+            text, question_id = question.question, question.id
+
+        res = self.client().post('/questions/create', json={
+            'question': '  ' + text.upper().rstrip('?') + ' ',
+            'answer': 'duplicate',
+            'difficulty': 1,
+            'category': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['duplicate_of'], question_id)
+
+    def test_400_for_question_without_answer(self):
+        res = self.client().post('/questions/create', json={'question': 'Incomplete?'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_bulk_import_reports_bad_rows(self):
+        rows = [
+            {'question': 'Bulk import test one?', 'answer': 'One', 'difficulty': 1, 'category': 1},
+            {'question': 'Bulk import test two?', 'answer': '', 'difficulty': 1, 'category': 1},
+            {'question': 'Bulk import test three?', 'answer': 'Three', 'difficulty': 1, 'category': 1},
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows)
+
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['errors'], [{'line': 2, 'error': 'answer is required'}])
+
+        with self.app.app_context():
+            imported = Question.query.filter(Question.question.like('Bulk import test%')).all()
+            self.assertEqual(len(imported), 2)
+            for question in imported:
+                question.delete()
+
+    def test_bulk_import_reports_undecodable_rows(self):
+        body = b'\xff\xfe\n' + json.dumps({
+            'question': 'Bulk import decode test?', 'answer': 'Yes', 'difficulty': 1, 'category': 1
+        }).encode('utf-8')
+
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['errors'][0]['line'], 1)
+        self.assertIn('invalid UTF-8', data['errors'][0]['error'])
+
+        rows = list(csv_rows(io.BytesIO(
+            b'question,answer,difficulty,category\n\xffbad,x,1,1\ngood,y,2,1\n')))
+        self.assertEqual([(line, error) for line, _, error in rows], [(2, 'invalid UTF-8'), (3, None)])
+
+        with self.app.app_context():
+            for question in Question.query.filter(Question.question == 'Bulk import decode test?'):
+                question.delete()
+
+    def test_csv_import_requires_a_header_row(self):
+        rows = list(csv_rows(io.StringIO('Headerless question?,Yes,1,1\n')))
+        self.assertEqual(rows, [(1, None, 'header row is missing question, answer, difficulty, category')])
+
+        rows = list(csv_rows(io.StringIO('')))
+        self.assertEqual([(line, row) for line, row, _ in rows], [(1, None)])
+
+        rows = list(csv_rows(io.StringIO('question,answer,category\nQ?,A,1\n')))
+        self.assertEqual(rows, [(1, None, 'header row is missing difficulty')])
+
+    def test_quiz_skips_previous_questions(self):
+        with self.app.app_context():
+            ids = [question.id for question in
+                   Question.query.filter(Question.category == 1).all()]
+
+        res = self.client().post('/quizzes', json={
+            'previous_questions': ids[:-1],
+            'quiz_category': {'type': 1, 'id': 0}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], ids[-1])
+
+    def test_quiz_returns_none_when_category_is_exhausted(self):
+        with self.app.app_context():
+            ids = [question.id for question in
+                   Question.query.filter(Question.category == 1).all()]
+
+        res = self.client().post('/quizzes', json={
+            'previous_questions': ids,
+            'quiz_category': {'type': 1, 'id': 0}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(data['question'])
+
+    def test_quiz_draws_questions_written_after_the_first_turn(self):
+        with self.app.app_context():
+            ids = [question.id for question in
+                   Question.query.filter(Question.category == 1).all()]
+        quiz = {'previous_questions': ids, 'quiz_category': {'type': 1, 'id': 0}}
+        self.client().post('/quizzes', json=quiz)
+
+        with self.app.app_context():
+            question = Question('Drawn after the first turn?', 'Yes', 1, 1)
+            question.insert()
+            question_id = question.id
+        added = json.loads(self.client().post('/quizzes', json=quiz).data)['question']
+
+        with self.app.app_context():
+            Question.query.get(question_id).delete()
+        removed = json.loads(self.client().post('/quizzes', json=quiz).data)['question']
+
+        self.assertEqual(added['id'], question_id)
+        self.assertIsNone(removed)
+
+    def test_400_for_invalid_previous_questions(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': 'none',
+            'quiz_category': {'type': 'click', 'id': 0}})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_400_for_invalid_quiz_category(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [], 'quiz_category': 'x'})
+        self.assertEqual(res.status_code, 400)
+
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': 'x'})
+        self.assertEqual(res.status_code, 400)
+
+    def play_session(self, client, quiz_category):
+        res = client().post('/quizzes/sessions', json={'quiz_category': quiz_category})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+
+        seen = []
+        for _ in range(data['total_questions'] + 1):
+            res = client().post('/quizzes/sessions/{}/next'.format(data['session_id']))
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            seen.append(question['id'])
+        return seen
+
+    def test_quiz_session_deals_each_question_once(self):
+        seen = self.play_session(self.client, {'type': 1, 'id': 0})
+
+        with self.app.app_context():
+            ids = [question.id for question in
+                   Question.query.filter(Question.category == 1).all()]
+
+        self.assertEqual(sorted(seen), sorted(ids))
+
+    def test_quiz_session_with_redis_store(self):
+        app = create_app({'QUIZ_SESSION_STORE': RedisQuizStore(FakeRedis())})
+        setup_db(app, self.database_path)
+        seen = self.play_session(app.test_client, {'type': 'click', 'id': 0})
+
+        with self.app.app_context():
+            total = Question.query.count()
+
+        self.assertEqual(len(set(seen)), total)
+
+    def test_404_for_unknown_quiz_session(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_get_pool_metrics(self):
+        self.client().get('/categories/stats')
+        res = self.client().get('/internal/pool')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn('pool', data['pools']['primary'])
+
+    def test_server_timing_header(self):
+        res = self.client().get('/categories/stats')
+        timings = res.headers.getlist('Server-Timing')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(timings[0].startswith('db;dur='))
+        self.assertIn('desc="1 queries"', timings[0])
+
+    def test_statement_shape_ignores_values(self):
+        self.assertEqual(
+            statement_shape("SELECT id FROM questions WHERE id IN (%(id_1)s, %(id_2)s) AND answer = 'it''s'"),
+            statement_shape("SELECT id FROM questions\n WHERE id IN (%(id_1)s) AND answer = 'Apollo 13'"))
+
+    def test_pool_profiles(self):
+        web = pool_options('postgres:///trivia', 'web')
+
+        self.assertEqual(web['pool_size'], 2)
+        self.assertTrue(web['pool_pre_ping'])
+        self.assertNotIn('pool_size', pool_options('sqlite:///trivia.db', 'web'))
+        with self.assertRaises(ValueError):
+            pool_options('postgres:///trivia', 'unknown')
+
+
+class MemoryQuizStoreTestCase(unittest.TestCase):
+    """This class represents the in-process quiz session store test case"""
+
+    def setUp(self):
+        self.now = 0
+        self.store = MemoryQuizStore(max_sessions=2, ttl=60, clock=lambda: self.now)
+
+    def test_pop_until_empty(self):
+        session_id = self.store.create({'type': 'click'}, [3, 2])
+
+        self.assertEqual(self.store.pop(session_id), ({'type': 'click'}, 2))
+        self.assertEqual(self.store.pop(session_id), ({'type': 'click'}, 3))
+        self.assertEqual(self.store.pop(session_id), ({'type': 'click'}, None))
+
+    def test_sessions_expire(self):
+        session_id = self.store.create(None, [1])
+        self.now = 61
+
+        with self.assertRaises(KeyError):
+            self.store.pop(session_id)
+
+    def test_least_recently_used_session_is_evicted(self):
+        first = self.store.create(None, [1, 2])
+        second = self.store.create(None, [1, 2])
+        self.store.pop(first)
+        self.store.create(None, [1, 2])
+
+        self.store.pop(first)
+        with self.assertRaises(KeyError):
+            self.store.pop(second)
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    """This class represents the read replica routing test case, on two SQLite files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary_path = 'sqlite:///' + os.path.join(self.directory, 'primary.db')
+        self.replica_path = 'sqlite:///' + os.path.join(self.directory, 'replica.db')
+
+        # each file gets the schema and one category telling them apart
+        for path, name in [(self.replica_path, 'Replica'), (self.primary_path, 'Primary')]:
+            app = create_app({'DATABASE_PATH': path})
+            with app.app_context():
+                Category(name).insert()
+
+    def tearDown(self):
+        replicas.configure([])
+        shutil.rmtree(self.directory)
+
+    def create_app(self, **config):
+        config.update({'DATABASE_PATH': self.primary_path, 'DATABASE_REPLICAS': [self.replica_path]})
+        return create_app(config).test_client
+
+    def test_reads_go_to_replica(self):
+        res = self.create_app()().get('/categories/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['categories'][0]['type'], 'Replica')
+
+    def test_writes_go_to_primary(self):
+        res = self.create_app()().post('/questions/create', json={
+            'question': 'Which file holds this question?',
+            'answer': 'The primary',
+            'category': 1,
+            'difficulty': 1
+        })
+
+        self.assertEqual(res.status_code, 201)
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.execute('SELECT count(*) FROM questions').scalar(), 1)
+
+    def test_reads_after_a_write_go_to_primary(self):
+        client = self.create_app()()
+        client.post('/questions/create', json={
+            'question': 'Which file holds this question?',
+            'answer': 'The primary',
+            'category': 1,
+            'difficulty': 1
+        })
+
+        res = client.get('/categories/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['categories'][0]['type'], 'Primary')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        res = self.create_app(REPLICA_MAX_LAG=-1)().get('/categories/stats')
+        data = json.loads(res.data)
 
+        self.assertEqual(data['categories'][0]['type'], 'Primary')
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
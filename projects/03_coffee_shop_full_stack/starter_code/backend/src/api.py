@@ -4,12 +4,15 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db, db_drop_and_create_all, pool_metrics, setup_db, Drink
 from .auth.auth import AuthError, requires_auth
+from .query_stats import QueryStats
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+# Server-Timing headers, N+1 warnings and slow request reports
+QueryStats(app)
 
 '''
 @TODO uncomment the following line to initialize the datbase
@@ -19,6 +22,19 @@ CORS(app)
 # db_drop_and_create_all()
 
 ## ROUTES
+'''
+GET /internal/pool
+    live connection pool metrics: checked out connections, overflow,
+    checkout waits and invalidated connections
+    keep /internal off the public proxy
+'''
+@app.route('/internal/pool')
+def get_pool_metrics():
+    return jsonify({
+        "success": True,
+        "pools": {"primary": pool_metrics(db.engine)}
+    })
+
 '''
 @TODO implement endpoint
     GET /drinks
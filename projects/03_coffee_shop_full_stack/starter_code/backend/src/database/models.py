@@ -1,5 +1,9 @@
 import os
-from sqlalchemy import Column, String, Integer
+import threading
+import time
+from sqlalchemy import Column, String, Integer, event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -10,15 +14,168 @@ database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filenam
 db = SQLAlchemy()
 
 '''
-setup_db(app)
+POOL_PROFILES
+    engine pool settings per deployment shape, chosen with the
+    DATABASE_POOL_PROFILE config key or environment variable
+    sizes are per process: N gunicorn workers hold at most
+    N * (pool_size + max_overflow) connections
+    DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT and
+    DATABASE_POOL_RECYCLE override single settings of the profile
+        default    single process development server
+        web        many single threaded gunicorn workers
+        threaded   gthread / gevent workers serving requests concurrently
+        batch      CLI commands and scripts
+'''
+POOL_PROFILES = {
+    'default': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': 1800},
+    'web': {'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 10, 'pool_recycle': 1800},
+    'threaded': {'pool_size': 10, 'max_overflow': 10, 'pool_timeout': 10, 'pool_recycle': 1800},
+    'batch': {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 60, 'pool_recycle': 3600},
+}
+POOL_ENVIRONMENT = {
+    'pool_size': 'DATABASE_POOL_SIZE',
+    'max_overflow': 'DATABASE_MAX_OVERFLOW',
+    'pool_timeout': 'DATABASE_POOL_TIMEOUT',
+    'pool_recycle': 'DATABASE_POOL_RECYCLE',
+}
+
+'''
+pool_options(database_path, profile)
+    SQLAlchemy engine options for a pool profile
+    connections are pinged before use and recycled; the pool sizes do not
+    apply to sqlite, which Flask-SQLAlchemy serves from a NullPool
+'''
+def pool_options(database_path, profile='default'):
+    if profile not in POOL_PROFILES:
+        raise ValueError('unknown pool profile {!r}, expected one of {}'.format(
+            profile, ', '.join(sorted(POOL_PROFILES))))
+
+    settings = dict(POOL_PROFILES[profile])
+    for option, variable in POOL_ENVIRONMENT.items():
+        if os.environ.get(variable):
+            settings[option] = int(os.environ[variable])
+
+    options = {'pool_pre_ping': True, 'pool_recycle': settings['pool_recycle']}
+    if make_url(database_path).get_backend_name() != 'sqlite':
+        options.update(settings, poolclass=MeteredQueuePool)
+    return options
+
+'''
+setup_db(app, database_path, pool_profile)
     binds a flask application and a SQLAlchemy service
+    pool_profile defaults to DATABASE_POOL_PROFILE from the app config or the
+    environment; SQLALCHEMY_ENGINE_OPTIONS in the app config override it
 '''
-def setup_db(app):
+def setup_db(app, database_path=database_path, pool_profile=None):
+    pool_profile = pool_profile or app.config.get('DATABASE_POOL_PROFILE') or \
+        os.environ.get('DATABASE_POOL_PROFILE', 'default')
+    options = pool_options(database_path, pool_profile)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
     db.app = app
     db.init_app(app)
 
+'''
+PoolStats
+    counters of a MeteredQueuePool: checkouts, new connections, invalidated
+    connections (stale ones caught by pre-ping among them), and how long
+    checkouts waited for a free connection or gave up after pool_timeout
+'''
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_longest = 0.0
+
+    def checkout(self, seconds, timed_out=False):
+        with self.lock:
+            self.wait_total += seconds
+            self.wait_longest = max(self.wait_longest, seconds)
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+
+    def connect(self):
+        with self.lock:
+            self.connects += 1
+
+    def invalidate(self, dbapi_connection, connection_record, exception):
+        with self.lock:
+            self.invalidations += 1
+
+    def format(self):
+        with self.lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'wait_total_ms': round(self.wait_total * 1000, 3),
+                'wait_mean_ms': round(self.wait_total * 1000 / waits, 3) if waits else 0.0,
+                'wait_max_ms': round(self.wait_longest * 1000, 3)
+            }
+
+'''
+MeteredQueuePool
+    QueuePool that keeps PoolStats
+    the stats carry over to the pool that replaces it on engine.dispose()
+'''
+class MeteredQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        recreated = '_dispatch' in kwargs
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        if not recreated:
+            event.listen(self, 'invalidate', self.stats.invalidate)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.checkout(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.checkout(time.perf_counter() - started)
+        return connection
+
+    def _create_connection(self):
+        self.stats.connect()
+        return super()._create_connection()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+'''
+pool_metrics(engine)
+    live pool utilization of an engine: size, checked out and overflow
+    connections of a queue pool, plus the PoolStats of a MeteredQueuePool
+'''
+def pool_metrics(engine):
+    pool = engine.pool
+    metrics = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'timeout': pool.timeout()
+        })
+    if isinstance(pool, MeteredQueuePool):
+        metrics.update(pool.stats.format())
+    return metrics
+
 '''
 db_drop_and_create_all()
     drops the database tables and starts fresh